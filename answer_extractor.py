@@ -0,0 +1,202 @@
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from llm_client import get_llm_client
+
+# How many of the best-scoring sentences are forwarded to the LLM.
+MAX_CANDIDATE_SENTENCES = 5
+# A sentence is only trusted as the answer without asking the LLM when it
+# covers this fraction of the question's weighted terms...
+DIRECT_ANSWER_THRESHOLD = 0.6
+# ...matches at least this many distinct question terms (one keyword also
+# matches headings and passing mentions)...
+MIN_DIRECT_MATCHED_TERMS = 2
+# ...beats the next-best sentence by this much...
+DIRECT_ANSWER_MARGIN = 0.2
+# ...and is long enough to be an answer rather than a heading.
+MIN_DIRECT_ANSWER_WORDS = 6
+
+# Extracted answers kept per (page text, question)
+MAX_CACHED_ANSWERS = 5000
+
+_answer_cache: "OrderedDict[str, str]" = OrderedDict()
+_answer_cache_lock = threading.Lock()
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "by",
+    "is", "are", "was", "were", "be", "been", "it", "its", "this", "that",
+    "these", "those", "as", "at", "from", "what", "which", "who", "whom",
+    "how", "why", "when", "where", "do", "does", "did", "can", "could",
+    "would", "should", "will", "explain", "discuss", "describe", "define",
+    "briefly", "give", "write", "short", "note", "notes", "between", "various",
+    "different", "types", "type", "following", "any", "their", "there",
+    "about", "example", "examples", "mention", "list", "state",
+}
+
+
+def _stem(token: str) -> str:
+    """Fold plurals so "firewalls" matches "firewall" and "policies" matches "policy"."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith(("sses", "xes", "ches", "shes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def _tokenize(text: str) -> List[str]:
+    """Lowercase, plural-folded word tokens with stopwords removed."""
+    return [_stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def score_sentences(sentences: List[str], question: str) -> List[float]:
+    """
+    Score each sentence against the question with IDF-weighted term overlap.
+    IDF is computed over the page's own sentences, so terms that appear
+    everywhere on the page count for little. Scores lie in [0, 1] and
+    represent the share of the question's weight covered by the sentence.
+    """
+    question_terms = set(_tokenize(question))
+    if not sentences or not question_terms:
+        return [0.0] * len(sentences)
+
+    sentence_terms = [set(_tokenize(s)) for s in sentences]
+    n = len(sentences)
+    idf = {}
+    for term in question_terms:
+        df = sum(1 for terms in sentence_terms if term in terms)
+        idf[term] = math.log((n + 1) / (df + 0.5))
+
+    total = sum(idf.values())
+    if total <= 0:
+        return [0.0] * n
+
+    return [sum(idf[t] for t in question_terms & terms) / total for terms in sentence_terms]
+
+
+def _split_sentences(chunk: str) -> List[str]:
+    from nltk.tokenize import sent_tokenize
+
+    return [s.strip() for s in sent_tokenize(chunk) if s.strip()]
+
+
+def preselect_sentences(chunk: str, question: str, top_n: int = MAX_CANDIDATE_SENTENCES) -> Tuple[List[str], List[float]]:
+    """
+    Split the page into sentences and keep the top_n most relevant ones to the
+    question, in their original page order, together with their scores.
+    """
+    sentences = _split_sentences(chunk)
+    if not sentences:
+        return [], []
+
+    scores = score_sentences(sentences, question)
+    ranked = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
+    keep = sorted(ranked[:top_n])
+    return [sentences[i] for i in keep], [scores[i] for i in keep]
+
+
+def select_direct_answer(candidates: List[str], scores: List[float], question: str,
+                         threshold: float = DIRECT_ANSWER_THRESHOLD) -> str:
+    """
+    Return the best pre-selected sentence if it is clearly the answer:
+    it clears the threshold, matches at least MIN_DIRECT_MATCHED_TERMS
+    question terms, beats the runner-up by DIRECT_ANSWER_MARGIN and has at
+    least MIN_DIRECT_ANSWER_WORDS words. Otherwise an empty string.
+    """
+    if not candidates:
+        return ""
+
+    ranked = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+    best = ranked[0]
+    runner_up = scores[ranked[1]] if len(ranked) > 1 else 0.0
+    matched = set(_tokenize(question)) & set(_tokenize(candidates[best]))
+
+    if (scores[best] < threshold
+            or scores[best] - runner_up < DIRECT_ANSWER_MARGIN
+            or len(matched) < MIN_DIRECT_MATCHED_TERMS
+            or len(candidates[best].split()) < MIN_DIRECT_ANSWER_WORDS):
+        return ""
+    return candidates[best]
+
+
+def build_extraction_prompt(excerpt: str, question: str) -> str:
+    return f"""
+Given the following notes and a question, extract the exact sentence(s) from the notes that directly answer the question if possible. Only return the excerpt(s), not any explanation.
+
+Notes:
+\"\"\"{excerpt}\"\"\"
+
+Question:
+\"\"\"{question}\"\"\"
+
+Answer/excerpt:
+"""
+
+
+def _answer_key(chunk: str, question: str) -> str:
+    return hashlib.sha256(f"{chunk}\x00{question}".encode("utf-8")).hexdigest()
+
+
+def get_cached_answer(chunk: str, question: str) -> Optional[str]:
+    """Return a previously extracted answer, or None if there is none."""
+    key = _answer_key(chunk, question)
+    with _answer_cache_lock:
+        answer = _answer_cache.get(key)
+        if answer is not None:
+            _answer_cache.move_to_end(key)
+        return answer
+
+
+def _cache_answer(chunk: str, question: str, answer: str):
+    with _answer_cache_lock:
+        _answer_cache[_answer_key(chunk, question)] = answer
+        if len(_answer_cache) > MAX_CACHED_ANSWERS:
+            _answer_cache.popitem(last=False)
+
+
+def extract_answer_from_chunk(chunk: str, question: str,
+                              on_text: Optional[Callable[[str], None]] = None) -> Optional[str]:
+    """
+    Extract the sentence(s) of the page that answer the question.
+    Sentences are pre-selected locally; a confident lexical match is returned
+    directly, otherwise only the candidate sentences are sent to the LLM.
+    With on_text, the LLM reply is streamed and on_text receives the answer
+    text so far each time more of it arrives.
+    Returns None when the LLM call failed; failures are not cached, so a
+    later call retries them.
+    """
+    cached = get_cached_answer(chunk, question)
+    if cached is not None:
+        return cached
+
+    candidates, scores = preselect_sentences(chunk, question)
+    if not candidates:
+        return ""
+
+    direct = select_direct_answer(candidates, scores, question)
+    if direct:
+        _cache_answer(chunk, question, direct)
+        return direct
+
+    prompt = build_extraction_prompt(" ".join(candidates), question)
+    try:
+        if on_text is None:
+            answer = get_llm_client().complete(prompt)
+        else:
+            text = ""
+            for piece in get_llm_client().stream(prompt):
+                text += piece
+                on_text(text.lstrip())
+            answer = text.strip()
+    except Exception as e:
+        print("Answer extraction failed:", e)
+        return None
+    _cache_answer(chunk, question, answer)
+    return answer
@@ -39,6 +39,38 @@ class PYQ(Base):
             f"sub_topic='{self.sub_topic}', year={self.year}, marks={self.marks})>"
         )
 
+class MatchJob(Base):
+    """A background PYQ-matching run for one uploaded PDF and subject."""
+    __tablename__ = "match_jobs"
+
+    id = Column(String, primary_key=True)  # sha256 of PDF bytes + subject
+    subject = Column(String, nullable=False)
+    filename = Column(String)
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed
+    total_pages = Column(Integer, nullable=False)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return (
+            f"<MatchJob(id='{self.id[:12]}', subject='{self.subject}', "
+            f"status='{self.status}', total_pages={self.total_pages})>"
+        )
+
+class MatchJobPage(Base):
+    """Persisted result of one processed page of a MatchJob."""
+    __tablename__ = "match_job_pages"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String, nullable=False)
+    page_index = Column(Integer, nullable=False)
+    result = Column(Text, nullable=False)  # JSON: subtopic, matches, answers
+
+    __table_args__ = (
+        Index("idx_match_job_pages_job_page", "job_id", "page_index", unique=True),
+    )
+
 # Function to create all tables
 def create_tables():
     """Create all database tables"""
@@ -48,6 +80,8 @@ def create_tables():
         print("Tables created:")
         print("- pdf_history")
         print("- pyqs (without difficulty column)")
+        print("- match_jobs")
+        print("- match_job_pages")
     except Exception as e:
         print(f"❌ Error creating tables: {e}")
 
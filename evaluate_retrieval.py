@@ -0,0 +1,247 @@
+"""
+Retrieval quality-vs-latency evaluation.
+
+Builds a labeled page -> PYQ relevance set from subjects/*.json (one synthetic
+notes page per PYQ, paraphrased from the question and padded with generic
+filler that is not PYQ text) and compares every retrieval
+configuration on recall@k, MRR and nDCG@k together with search latency and
+memory, so a speed-up can be accepted or rejected on data.
+
+Usage:
+    python evaluate_retrieval.py [--subject "Cyber Security"] [--k 3] [--limit 20]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from pyq_store import PYQColumns
+from subtopic_router import SubtopicRouter
+from vector_search import PYQMatrixIndex
+
+# Instruction words stripped from a question when turning it into notes text
+_QUESTION_PREFIXES = re.compile(
+    r"^(what (is|are)( the)?|explain( the)?|discuss( the)?|describe( the)?|define( the)?|"
+    r"give( the)?|write (a )?short note on|distinguish between|differentiate between|"
+    r"how (is|are|do|does)|why (is|are)|briefly)\s+",
+    re.IGNORECASE,
+)
+
+_SYNONYMS = {
+    "various": "different",
+    "types": "kinds",
+    "stages": "phases",
+    "method": "procedure",
+    "methods": "techniques",
+    "concept": "idea",
+    "role": "function",
+    "challenges": "difficulties",
+    "prevent": "stop",
+    "attack": "attacks",
+    "merits": "advantages",
+    "demerits": "disadvantages",
+    "process": "procedure",
+    "determination": "measurement",
+    "removal": "elimination",
+}
+
+# The sub_topic name is deliberately left out, so routed search gets no free hint
+_NOTE_TEMPLATES = [
+    "This section covers {topic}. In practice, {topic} is commonly examined.",
+    "Notes on {topic}: the key points are summarised below.",
+    "{Topic} is an important topic. We look at it in detail here.",
+    "Lecture summary - {topic}.",
+]
+
+# Padding that reads like notes but matches no PYQ, so only the graded PYQs are relevant
+_FILLER_SENTENCES = [
+    "Refer to the prescribed textbook for further reading.",
+    "The diagram on the next slide illustrates the overall flow.",
+    "These points were discussed in the previous lecture as well.",
+    "Make sure to revise this part before the internal assessment.",
+    "An example is worked out in the tutorial sheet.",
+    "Students often confuse the terminology, so read carefully.",
+    "The summary at the end of the chapter lists the key terms.",
+    "Attendance for the lab session is compulsory.",
+]
+
+
+def _paraphrase(question: str, rng: random.Random) -> str:
+    """Turn a question into a notes-style statement with a few synonym swaps."""
+    topic = _QUESTION_PREFIXES.sub("", question.strip()).rstrip("?.")
+    words = [_SYNONYMS.get(w.lower(), w) if rng.random() < 0.7 else w for w in topic.split()]
+    return " ".join(words)
+
+
+def build_eval_set(entries: List[Dict], seed: int = 0, filler_sentences: int = 2) -> List[Dict]:
+    """
+    One synthetic page per PYQ. Relevance grades: 2 for the PYQ the page was
+    written from (and any copy of the same question from another year),
+    1 for other PYQs of the same sub_topic.
+    """
+    rng = random.Random(seed)
+    by_question: Dict[str, List[int]] = {}
+    by_subtopic: Dict[str, List[int]] = {}
+    for i, entry in enumerate(entries):
+        by_question.setdefault(entry["question"].strip().lower(), []).append(i)
+        by_subtopic.setdefault(entry.get("sub_topic") or "", []).append(i)
+
+    pages = []
+    for i, entry in enumerate(entries):
+        topic = _paraphrase(entry["question"], rng)
+        template = rng.choice(_NOTE_TEMPLATES)
+        sentences = [template.format(topic=topic, Topic=topic[:1].upper() + topic[1:])]
+        # Filler keeps the page realistic without mentioning any other PYQ
+        sentences += rng.sample(_FILLER_SENTENCES, min(filler_sentences, len(_FILLER_SENTENCES)))
+        rng.shuffle(sentences)
+
+        grades = {j: 1 for j in by_subtopic[entry.get("sub_topic") or ""]}
+        grades.update({j: 2 for j in by_question[entry["question"].strip().lower()]})
+        pages.append({"text": " ".join(sentences), "grades": grades})
+    return pages
+
+
+def recall_at_k(ranked: List[int], grades: Dict[int, int], k: int) -> float:
+    relevant = {j for j, g in grades.items() if g == 2}
+    return len(relevant & set(ranked[:k])) / len(relevant)
+
+
+def reciprocal_rank(ranked: List[int], grades: Dict[int, int]) -> float:
+    for rank, j in enumerate(ranked, start=1):
+        if grades.get(j) == 2:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranked: List[int], grades: Dict[int, int], k: int) -> float:
+    dcg = sum((2 ** grades.get(j, 0) - 1) / math.log2(rank + 1) for rank, j in enumerate(ranked[:k], start=1))
+    ideal = sorted(grades.values(), reverse=True)[:k]
+    idcg = sum((2 ** g - 1) / math.log2(rank + 1) for rank, g in enumerate(ideal, start=1))
+    return dcg / idcg if idcg else 0.0
+
+
+def build_configurations(entries: List[Dict], embedding) -> Dict[str, Tuple[Callable, int, bool]]:
+    """
+    Build every retrieval configuration over the same PYQ embeddings.
+    Returns {name: (search(query_vector, k) -> PYQ rows, index bytes, traced)}.
+    traced is False when the search allocates in native code (FAISS), which
+    tracemalloc cannot see.
+    """
+    import faiss
+
+    store = PYQColumns(
+        [e["question"] for e in entries],
+        [e.get("subject") for e in entries],
+        [e.get("sub_topic") for e in entries],
+        [int(e["year"]) if str(e.get("year", "")).isdigit() else None for e in entries],
+        [e.get("marks") for e in entries],
+    )
+    matrix = PYQMatrixIndex(embedding.embed_documents(list(store.questions())), store)
+    router = SubtopicRouter(matrix)
+
+    flat = faiss.IndexFlatL2(matrix.vectors.shape[1])
+    flat.add(matrix.vectors)
+
+    def faiss_search(v, k):
+        _, rows = flat.search(np.asarray([v], dtype=np.float32), k)
+        return [r for r in rows[0].tolist() if r >= 0]
+
+    configs = {
+        "faiss (flat L2)": (faiss_search, flat.ntotal * flat.d * 4, False),
+        "numpy exact": (lambda v, k: matrix.search_batch([v], k)[0], matrix.vectors.nbytes, True),
+        "numpy + MMR 0.7": (lambda v, k: matrix.search_batch([v], k, mmr_lambda=0.7)[0], matrix.vectors.nbytes, True),
+        "routed (1 subtopic)": (lambda v, k: router.search_rows(v, k, n_subtopics=1)[1],
+                                matrix.vectors.nbytes + router.nbytes, True),
+        "routed (3 subtopics)": (lambda v, k: router.search_rows(v, k, n_subtopics=3)[1],
+                                 matrix.vectors.nbytes + router.nbytes, True),
+    }
+    return configs
+
+
+def evaluate(entries: List[Dict], k: int = 3, seed: int = 0) -> List[Dict]:
+    """
+    Run every configuration over the synthetic pages of one subject.
+    Query embeddings are computed once up front, so latency covers search only.
+    """
+    from rag_pipeline import get_embedding
+
+    embedding = get_embedding()
+    pages = build_eval_set(entries, seed=seed)
+    query_vectors = embedding.embed_documents([p["text"] for p in pages])
+    configs = build_configurations(entries, embedding)
+
+    rows = []
+    for name, (search, index_bytes, traced) in configs.items():
+        latencies, recalls, rrs, ndcgs = [], [], [], []
+        for page, vector in zip(pages, query_vectors):
+            start = time.perf_counter()
+            ranked = search(vector, k)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(recall_at_k(ranked, page["grades"], k))
+            rrs.append(reciprocal_rank(ranked, page["grades"]))
+            ndcgs.append(ndcg_at_k(ranked, page["grades"], k))
+
+        # Separate pass so tracing does not distort the latency numbers
+        peak = None
+        if traced:
+            tracemalloc.start()
+            for vector in query_vectors:
+                search(vector, k)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        rows.append({
+            "config": name,
+            f"recall@{k}": float(np.mean(recalls)),
+            "MRR": float(np.mean(rrs)),
+            f"nDCG@{k}": float(np.mean(ndcgs)),
+            "p50 ms": float(np.percentile(latencies, 50) * 1000),
+            "p95 ms": float(np.percentile(latencies, 95) * 1000),
+            "index KB": index_bytes / 1024,
+            # Not comparable for native allocations, so left out there
+            "peak query KB": peak / 1024 if peak is not None else "n/a",
+        })
+    return rows
+
+
+def format_table(rows: List[Dict]) -> str:
+    """Render result rows as a Markdown table."""
+    headers = list(rows[0].keys())
+    lines = ["| " + " | ".join(headers) + " |", "|" + "|".join("---" for _ in headers) + "|"]
+    for row in rows:
+        cells = [row[h] if isinstance(row[h], str) else f"{row[h]:.3f}" for h in headers]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare retrieval configurations on quality and latency.")
+    parser.add_argument("--subject", help="Only evaluate this subject (JSON file name without extension)")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--limit", type=int, help="Use at most this many PYQs per subject")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    subjects_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "subjects")
+    json_files = sorted(f for f in os.listdir(subjects_dir) if f.endswith(".json"))
+    if args.subject:
+        json_files = [f for f in json_files if os.path.splitext(f)[0] == args.subject]
+    if not json_files:
+        print("❌ No matching JSON files found in the 'subjects' folder.")
+        exit(1)
+
+    for filename in json_files:
+        with open(os.path.join(subjects_dir, filename), "r", encoding="utf-8") as f:
+            entries = [e for e in json.load(f) if e.get("question")]
+        if args.limit:
+            entries = entries[:args.limit]
+
+        print(f"\n📊 {os.path.splitext(filename)[0]} ({len(entries)} PYQs, k={args.k})\n")
+        print(format_table(evaluate(entries, k=args.k, seed=args.seed)))
@@ -0,0 +1,143 @@
+"""
+Minimal OpenAI-compatible chat completions server for local testing.
+
+Serves POST /v1/chat/completions (plain and streaming) with a fixed reply,
+an optional delay and optional injected 429 errors, and counts the requests
+it receives. Point the app's chat calls at it with LLM_BASE_URL; embeddings
+still go to OpenAI, so an API key is needed (use LLM_PROVIDER=offline to run
+without any API):
+
+    python fake_openai_server.py --port 8000
+    LLM_BASE_URL=http://127.0.0.1:8000/v1 streamlit run main.py
+
+Do not use OPENAI_BASE_URL for this: the OpenAI SDK reads it for every
+client, so embeddings would be sent here too and fail with 404.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "This is a fake answer."
+
+
+class FakeOpenAIServer:
+    """
+    Runs the fake server in a background thread. Use as a context manager or
+    call start()/stop(). requests counts chat completion requests received
+    (including rejected ones).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, reply: str = DEFAULT_REPLY,
+                 delay: float = 0.0, fail_first: int = 0):
+        self.reply = reply
+        self.delay = delay
+        self.fail_first = fail_first
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+                    return
+
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                    reject = server.fail_first > 0
+                    if reject:
+                        server.fail_first -= 1
+                if reject:
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}})
+                    return
+
+                time.sleep(server.delay)
+                model = body.get("model", "fake")
+                if body.get("stream"):
+                    self._stream(model)
+                else:
+                    self._send_json(200, {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": server.reply}}],
+                        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                    })
+
+            def _stream(self, model: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                words = server.reply.split(" ")
+                for i, word in enumerate(words):
+                    delta = {"content": word if i == 0 else " " + word}
+                    if i == 0:
+                        delta["role"] = "assistant"
+                    chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk",
+                             "created": int(time.time()), "model": model,
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                done = {"id": "chatcmpl-fake", "object": "chat.completion.chunk",
+                        "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat completions API.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(port=args.port, reply=args.reply, delay=args.delay)
+    print(f"Fake OpenAI server on {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server._httpd.server_close()
@@ -0,0 +1,340 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from database import Base, MatchJob, MatchJobPage, SessionLocal, engine
+from latency_budget import PAGE_LATENCY_BUDGET_SECONDS, UPLOAD_LATENCY_BUDGET_SECONDS, LatencyBudget
+from page_dedup import NearDuplicateIndex, simhash
+from page_processor import process_page, remember_page, start_search
+
+# Uploads processed concurrently; pages within one upload run one at a time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="intelliject-job")
+_running: Dict[str, Future] = {}
+# Sessions viewing the same PDF and subject share one job. Each keeps its own
+# pending pages (most recent request served first) and latency budget.
+DEFAULT_REQUESTER = "default"
+_pending: Dict[str, "OrderedDict[str, List[int]]"] = {}
+_running_lock = threading.Lock()
+# Latency budget and timeout/cancellation counts per job and requester, for this process
+_budgets: Dict[str, Dict[str, LatencyBudget]] = {}
+# When each (job, requester) last submitted or polled its stats. Budgets idle
+# for longer than this are dropped once their job is idle and has no late answers.
+BUDGET_IDLE_SECONDS = 600
+_last_seen: Dict[Tuple[str, str], float] = {}
+# Serializes late answer writes to the same page row
+_late_lock = threading.Lock()
+# PYQ rows already shown per job (row -> pages), so the "exact" backend keeps
+# spreading PYQs across every batch of the upload, not just within one.
+# Dropped once the job is done or failed.
+_shown: Dict[str, Dict[int, int]] = {}
+# Pages whose answers are still streaming in: job id -> page index -> latest snapshot
+_previews: Dict[str, Dict[int, Dict]] = {}
+
+_tables_ready = False
+_tables_lock = threading.Lock()
+
+
+def _ensure_tables():
+    global _tables_ready
+    with _tables_lock:
+        if not _tables_ready:
+            Base.metadata.create_all(bind=engine, tables=[MatchJob.__table__, MatchJobPage.__table__])
+            _tables_ready = True
+
+
+def job_id_for(pdf_bytes: bytes, subject: str) -> str:
+    """
+    Stable job id for an upload, so reruns and reconnects with the same PDF
+    and subject reattach to the same job.
+    """
+    digest = hashlib.sha256(pdf_bytes)
+    digest.update(b"\x00" + subject.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """Return the job's status fields, or None if it was never submitted."""
+    _ensure_tables()
+    with SessionLocal() as db:
+        job = db.get(MatchJob, job_id)
+        if job is None:
+            return None
+        return {
+            "id": job.id,
+            "subject": job.subject,
+            "filename": job.filename,
+            "status": job.status,
+            "total_pages": job.total_pages,
+            "error": job.error,
+        }
+
+
+def get_job_pages(job_id: str) -> Dict[int, Dict]:
+    """Return the persisted page results of a job, keyed by page index."""
+    _ensure_tables()
+    with SessionLocal() as db:
+        rows = db.query(MatchJobPage.page_index, MatchJobPage.result).filter(MatchJobPage.job_id == job_id).all()
+    return {page_index: json.loads(result) for page_index, result in rows}
+
+
+def get_job_stats(job_id: str, requester: str = DEFAULT_REQUESTER) -> Optional[Dict[str, float]]:
+    """
+    Return the latency budget counters (timeouts, cancellations, late_answers,
+    outstanding, spent_seconds) of the pages processed for this requester, or
+    None if it has not submitted the job in this process.
+    """
+    budget = _budgets.get(job_id, {}).get(requester)
+    if budget is None:
+        return None
+    _last_seen[(job_id, requester)] = time.monotonic()
+    return budget.stats()
+
+
+def count_outstanding_answers(job_id: str) -> int:
+    """Answers of the job, for any requester, still being computed after their page deadline."""
+    return sum(budget.stats()["outstanding"] for budget in list(_budgets.get(job_id, {}).values()))
+
+
+def get_job_previews(job_id: str) -> Dict[int, Dict]:
+    """
+    Return snapshots of the job's pages whose answers are still streaming,
+    keyed by page index. Snapshots have subtopic, matches, the answer text
+    received so far and the indexes of answers still "streaming".
+    """
+    return dict(_previews.get(job_id, {}))
+
+
+def _needs_retry(result: Dict) -> bool:
+    """Pages whose retrieval or some answer failed are processed again when requested."""
+    return "error" in result or bool(result.get("failed"))
+
+
+def _save_page(job_id: str, page_index: int, result: Dict):
+    """Persist a page result, replacing the one of an earlier failed attempt."""
+    with _late_lock, SessionLocal() as db:
+        row = (db.query(MatchJobPage)
+               .filter(MatchJobPage.job_id == job_id, MatchJobPage.page_index == page_index)
+               .one_or_none())
+        if row is None:
+            db.add(MatchJobPage(job_id=job_id, page_index=page_index, result=json.dumps(result)))
+        else:
+            row.result = json.dumps(result)
+        db.commit()
+
+
+def _reopen_job(job_id: str):
+    """Put a finished job back to "paused" so submit_job retries its failed pages."""
+    with _running_lock:
+        if job_id not in _running and get_job(job_id)["status"] == "done":
+            _set_status(job_id, "paused")
+
+
+def _set_preview(job_id: str, page_index: int, snapshot: Dict):
+    _previews.setdefault(job_id, {})[page_index] = dict(snapshot, page=page_index + 1)
+
+
+def _drop_preview(job_id: str, page_index: int):
+    previews = _previews.get(job_id)
+    if previews is not None:
+        previews.pop(page_index, None)
+
+
+def _fill_late_answer(job_id: str, subject: str, chunk: str, page_index: int, idx: int,
+                      budget: LatencyBudget, upload_pages: NearDuplicateIndex, future: Future):
+    """
+    Write an answer that finished after its page deadline into the persisted
+    page. Once the page is complete it is offered for near-duplicate reuse.
+    A failed answer stays None and is listed under "failed", so resubmitting
+    the job retries the page.
+    """
+    answer = None
+    try:
+        answer = future.result()
+    except Exception as e:
+        print("Late answer failed:", e)
+
+    try:
+        with _late_lock, SessionLocal() as db:
+            row = (db.query(MatchJobPage)
+                   .filter(MatchJobPage.job_id == job_id, MatchJobPage.page_index == page_index)
+                   .one())
+            result = json.loads(row.result)
+            result["answers"][idx] = answer
+            if answer is None:
+                result["failed"] = sorted({*result.get("failed", []), idx})
+            row.result = json.dumps(result)
+            db.commit()
+        if answer is None:
+            _reopen_job(job_id)
+        remember_page(chunk, subject, result, upload_pages)
+        settled = set(result.get("skipped", [])) | set(result.get("failed", []))
+        if all(a is not None or i in settled for i, a in enumerate(result["answers"])):
+            _drop_preview(job_id, page_index)
+    except Exception as e:
+        print(f"Could not store late answer for page {page_index + 1}:", e)
+    finally:
+        budget.record(late_answers=1, outstanding=-1)
+
+
+def _set_status(job_id: str, status: str, error: str = None):
+    with SessionLocal() as db:
+        job = db.get(MatchJob, job_id)
+        job.status = status
+        job.error = error
+        db.commit()
+
+
+def _next_page(job_id: str, done: Dict[int, Dict], total_pages: int) -> Optional[Tuple[int, str]]:
+    """
+    Pop the next requested page of the job as (page index, requester), taking
+    the most recent request first. With nothing left the worker retires while
+    holding the lock, so a concurrent submit_job starts a new one. The job is
+    only "done" once every page is persisted without failures.
+    """
+    with _running_lock:
+        requests = _pending.get(job_id, {})
+        for requester in reversed(requests):
+            pending = requests[requester]
+            while pending:
+                page_index = pending.pop(0)
+                if page_index not in done:
+                    return page_index, requester
+
+        finished = sum(not _needs_retry(result) for result in get_job_pages(job_id).values())
+        _set_status(job_id, "done" if finished == total_pages else "paused")
+        if finished == total_pages:
+            _shown.pop(job_id, None)
+        _pending.pop(job_id, None)
+        _running.pop(job_id, None)
+        return None
+
+
+def _pending_snapshot(job_id: str) -> List[int]:
+    """All pages still requested by any requester of the job."""
+    with _running_lock:
+        return sorted({p for pages in _pending.get(job_id, {}).values() for p in pages})
+
+
+def _run_job(job_id: str, subject: str, chunks: List[str]):
+    # Pages are retrieved in batches of everything pending, with one embedding request;
+    # each page waits for its batch only until its own deadline
+    batch_retrieval = True
+    retrieved: Dict[int, Future] = {}
+    shown = _shown.setdefault(job_id, {})
+    try:
+        _set_status(job_id, "running")
+
+        # Pages finished earlier (or before a restart) are kept; they still seed duplicate detection.
+        # Pages that failed are processed again.
+        done = {i: result for i, result in get_job_pages(job_id).items() if not _needs_retry(result)}
+        upload_pages = NearDuplicateIndex()
+        for page_index, result in done.items():
+            if None not in result["answers"]:
+                upload_pages.add(simhash(chunks[page_index]), result)
+
+        while True:
+            task = _next_page(job_id, done, len(chunks))
+            if task is None:
+                break
+            i, requester = task
+            budget = _budgets[job_id][requester]
+            if batch_retrieval and i not in retrieved:
+                # Batched in page order so PYQs are spread from the first page onwards
+                batch = sorted({i, *(p for p in _pending_snapshot(job_id) if p not in done)})
+                retrieved.update(zip(batch, start_search([chunks[p] for p in batch], subject, shown)))
+            search = retrieved.pop(i, None)
+            result, outstanding = process_page(chunks[i], subject, i, upload_pages, search,
+                                               budget, partial(_set_preview, job_id, i))
+            if search is not None and search.done() and search.exception() is not None:
+                print("Batch retrieval failed, matching pages one by one:", search.exception())
+                batch_retrieval = False
+                retrieved.clear()
+            # Failed pages are shown with their error but stay pending for the next request
+            _save_page(job_id, i, result)
+            if not _needs_retry(result):
+                done[i] = result
+            if not outstanding:
+                _drop_preview(job_id, i)
+            # The page is shown now; answers past its deadline are written in when they arrive
+            for idx, future in outstanding.items():
+                future.add_done_callback(partial(_fill_late_answer, job_id, subject, chunks[i], i, idx,
+                                                 budget, upload_pages))
+    except Exception as e:
+        print(f"Match job {job_id[:12]} failed:", e)
+        with _running_lock:
+            _set_status(job_id, "failed", str(e))
+            _shown.pop(job_id, None)
+            _pending.pop(job_id, None)
+            _running.pop(job_id, None)
+
+
+def _drop_idle_budgets():
+    """
+    Forget the budgets of requesters that stopped submitting and polling,
+    once their job is not running and none of their late answers are pending.
+    Called with _running_lock held.
+    """
+    now = time.monotonic()
+    for job_id in [j for j in _budgets if j not in _running]:
+        budgets = _budgets[job_id]
+        for requester in list(budgets):
+            idle = now - _last_seen.get((job_id, requester), now)
+            if idle > BUDGET_IDLE_SECONDS and budgets[requester].stats()["outstanding"] == 0:
+                del budgets[requester]
+                _last_seen.pop((job_id, requester), None)
+        if not budgets:
+            del _budgets[job_id]
+
+
+def submit_job(job_id: str, subject: str, filename: str, chunks: List[str], pages: Optional[List[int]] = None,
+               page_budget: float = PAGE_LATENCY_BUDGET_SECONDS, upload_budget: float = UPLOAD_LATENCY_BUDGET_SECONDS,
+               requester: str = DEFAULT_REQUESTER):
+    """
+    Process the given pages of the upload in the background (all pages when
+    pages is None). The request replaces the requester's earlier pending
+    pages, so a viewer that moved on does not pay for pages it no longer
+    shows; pages requested by other sessions of the same job are kept.
+    Finished pages are never recomputed, pages whose retrieval or answers
+    failed are retried, and jobs left unfinished by a server restart resume
+    from their last persisted page.
+    page_budget and upload_budget are the requester's latency budgets in
+    seconds (0 = none); a new value replaces them but keeps the counters.
+    """
+    _ensure_tables()
+    pages = list(range(len(chunks))) if pages is None else list(pages)
+    with _running_lock:
+        _drop_idle_budgets()
+        with SessionLocal() as db:
+            job = db.get(MatchJob, job_id)
+            if job is not None and job.status == "done":
+                return
+            if job is None:
+                db.add(MatchJob(id=job_id, subject=subject, filename=filename,
+                                status="queued", total_pages=len(chunks)))
+            elif job_id not in _running:
+                job.status = "queued"
+                job.error = None
+            db.commit()
+
+        _last_seen[(job_id, requester)] = time.monotonic()
+        budgets = _budgets.setdefault(job_id, {})
+        budget = budgets.get(requester)
+        if budget is None:
+            budgets[requester] = LatencyBudget(page_budget, upload_budget)
+        else:
+            budget.page_seconds = page_budget or None
+            budget.upload_seconds = upload_budget or None
+
+        requests = _pending.setdefault(job_id, OrderedDict())
+        requests[requester] = pages
+        requests.move_to_end(requester)
+        if job_id not in _running:
+            _running[job_id] = _executor.submit(_run_job, job_id, subject, chunks)
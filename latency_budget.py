@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+# Defaults for new uploads; 0 disables a budget
+PAGE_LATENCY_BUDGET_SECONDS = float(os.getenv("PAGE_LATENCY_BUDGET_SECONDS", "10"))
+UPLOAD_LATENCY_BUDGET_SECONDS = float(os.getenv("UPLOAD_LATENCY_BUDGET_SECONDS", "0"))
+
+
+class Deadline:
+    """A point in time after which a stage should stop waiting (None = no limit)."""
+
+    def __init__(self, seconds: Optional[float]):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+
+class LatencyBudget:
+    """
+    Latency budget of one upload. Each page gets a deadline of page_seconds,
+    capped by what is left of upload_seconds; the upload budget is charged
+    with the time actually spent on pages, so idle time in the paginated
+    viewer does not use it up. Also counts timeouts and cancellations.
+    """
+
+    def __init__(self, page_seconds: float = PAGE_LATENCY_BUDGET_SECONDS,
+                 upload_seconds: float = UPLOAD_LATENCY_BUDGET_SECONDS):
+        self.page_seconds = page_seconds or None
+        self.upload_seconds = upload_seconds or None
+        self._spent = 0.0
+        self._stats = {"timeouts": 0, "cancellations": 0, "late_answers": 0, "outstanding": 0}
+        self._lock = threading.Lock()
+
+    def upload_remaining(self) -> Optional[float]:
+        if self.upload_seconds is None:
+            return None
+        with self._lock:
+            return max(0.0, self.upload_seconds - self._spent)
+
+    def upload_exhausted(self) -> bool:
+        remaining = self.upload_remaining()
+        return remaining is not None and remaining <= 0
+
+    def page_deadline(self) -> Deadline:
+        """Deadline for a page starting now, covering its retrieval and answers."""
+        limits = [s for s in (self.page_seconds, self.upload_remaining()) if s is not None]
+        return Deadline(max(0.0, min(limits)) if limits else None)
+
+    def charge(self, seconds: float):
+        with self._lock:
+            self._spent += seconds
+
+    def record(self, **counts: int):
+        """Add to the counters, e.g. record(timeouts=2, outstanding=2)."""
+        with self._lock:
+            for name, value in counts.items():
+                self._stats[name] += value
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._stats, spent_seconds=self._spent)
@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterator, List, Optional, Protocol, Tuple, TYPE_CHECKING
+
+from dotenv import load_dotenv
+
+# httpx, LangChain and the OpenAI SDK are imported when the first client is
+# created so that importing this module stays cheap.
+if TYPE_CHECKING:
+    import httpx
+
+load_dotenv()
+
+# Shared budget for every session in this process. Defaults sit under the
+# gpt-3.5-turbo tier-1 limits; override through the environment.
+REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "3000"))
+TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "150000"))
+# Point the chat calls (only) at a local fake server, e.g. fake_openai_server.py on
+# http://127.0.0.1:8000/v1, for testing. Not OPENAI_BASE_URL: the OpenAI SDK
+# reads that one itself, so it would also redirect the embeddings.
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+# "offline" replaces both the chat model and the embeddings with local
+# stand-ins, so the app runs without network or API key (development and demos)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()
+# Delay between streamed words of the offline provider, to mimic a real model
+OFFLINE_TOKEN_DELAY_SECONDS = float(os.getenv("OFFLINE_TOKEN_DELAY_SECONDS", "0.05"))
+
+# Per-request timeout, so one hanging call cannot stall a page indefinitely
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20.0
+# Completion tokens reserved per request when charging the token budget.
+COMPLETION_TOKEN_ALLOWANCE = 256
+
+
+class ChatClient(Protocol):
+    """What callers of get_llm_client() can rely on, for every provider."""
+
+    model: str
+
+    def complete(self, prompt: str) -> str:
+        ...
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        ...
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Rough token count (~4 characters per token) plus the completion allowance."""
+    return len(prompt) // 4 + COMPLETION_TOKEN_ALLOWANCE
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests per minute and tokens per minute.
+    acquire() blocks until both buckets can cover the request.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60.0)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60.0)
+
+    def acquire(self, tokens: int):
+        # A single request larger than the whole bucket would wait forever
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60.0 / self.requests_per_minute,
+                    (tokens - self._tokens) * 60.0 / self.tokens_per_minute,
+                )
+            time.sleep(max(wait, 0.01))
+
+
+class LLMClient:
+    """
+    Process-wide chat client. Reuses one pooled HTTP connection set, coalesces
+    identical in-flight prompts into a single upstream request and keeps all
+    callers inside the shared rate budget.
+    """
+
+    def __init__(self, model: str, temperature: float, limiter: RateLimiter, http_client: httpx.Client,
+                 base_url: Optional[str] = LLM_BASE_URL):
+        from langchain_openai import ChatOpenAI
+        from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+        self.model = model
+        self.temperature = temperature
+        self._retryable_errors = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+        self._limiter = limiter
+        # Retries are handled here so they go through the shared limiter
+        self._llm = ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            base_url=base_url,
+            http_client=http_client,
+            timeout=REQUEST_TIMEOUT_SECONDS,
+            max_retries=0,
+        )
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, prompt: str) -> str:
+        raw = f"{self.model}\x00{self.temperature}\x00{prompt}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _backoff(attempt: int):
+        delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+        time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def _call_with_backoff(self, prompt: str) -> str:
+        tokens = estimate_tokens(prompt)
+        for attempt in range(MAX_RETRIES + 1):
+            self._limiter.acquire(tokens)
+            try:
+                return self._llm.invoke(prompt).content.strip()
+            except self._retryable_errors:
+                if attempt == MAX_RETRIES:
+                    raise
+                self._backoff(attempt)
+
+    def _stream_with_backoff(self, prompt: str) -> Iterator[str]:
+        tokens = estimate_tokens(prompt)
+        for attempt in range(MAX_RETRIES + 1):
+            self._limiter.acquire(tokens)
+            started = False
+            try:
+                for chunk in self._llm.stream(prompt):
+                    if chunk.content:
+                        started = True
+                        yield chunk.content
+                return
+            except self._retryable_errors:
+                # Text already handed out cannot be taken back, so only retry before the first token
+                if started or attempt == MAX_RETRIES:
+                    raise
+                self._backoff(attempt)
+
+    def complete(self, prompt: str) -> str:
+        """
+        Return the model's reply to the prompt. Concurrent callers with the
+        same prompt share the result of one request.
+        """
+        key = self._key(prompt)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._call_with_backoff(prompt)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        Yield the model's reply to the prompt piece by piece as it is generated.
+        A caller whose prompt is already in flight receives the whole reply as
+        one piece once that request finishes.
+        """
+        key = self._key(prompt)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            yield future.result()
+            return
+
+        pieces = []
+        try:
+            for piece in self._stream_with_backoff(prompt):
+                pieces.append(piece)
+                yield piece
+            future.set_result("".join(pieces).strip())
+        except GeneratorExit:
+            # The consumer stopped reading; callers waiting on this prompt must not hang
+            future.set_exception(RuntimeError("Streaming request was abandoned"))
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+class OfflineLLMClient:
+    """
+    Local stand-in for LLMClient with the same complete()/stream() interface.
+    For a prompt with triple-quoted notes and question blocks (the extraction
+    prompt) it replies with the notes sentence sharing most words with the
+    question, streamed word by word.
+    """
+
+    _QUOTED_RE = re.compile(r'"""(.*?)"""', re.DOTALL)
+    _SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+    _WORD_RE = re.compile(r"[a-z0-9]+")
+
+    def __init__(self, token_delay: float = OFFLINE_TOKEN_DELAY_SECONDS):
+        self.model = "offline"
+        self.token_delay = token_delay
+
+    def _reply(self, prompt: str) -> str:
+        blocks = self._QUOTED_RE.findall(prompt) or [prompt]
+        sentences = [" ".join(s.split()) for s in self._SENTENCE_RE.split(blocks[0].strip()) if s.strip()]
+        if not sentences:
+            return ""
+        question = set(self._WORD_RE.findall(blocks[1].lower())) if len(blocks) > 1 else set()
+        return max(sentences, key=lambda s: len(question & set(self._WORD_RE.findall(s.lower()))))
+
+    def complete(self, prompt: str) -> str:
+        return "".join(self.stream(prompt)).strip()
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for i, word in enumerate(self._reply(prompt).split(" ")):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
+
+
+class OfflineEmbeddings:
+    """
+    Local stand-in for OpenAIEmbeddings (embed_documents/embed_query): hashed
+    bag-of-words vectors, so texts sharing words are similar. Good enough to
+    exercise retrieval offline, not a substitute for real embeddings.
+    """
+
+    _WORD_RE = re.compile(r"[a-z0-9]+")
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for word in self._WORD_RE.findall(text.lower()):
+            # Fold simple plurals so "firewalls" and "firewall" share a bucket
+            if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+                word = word[:-1]
+            h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+            vector[h % self.dimensions] += 1.0 if (h >> 32) & 1 else -1.0
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+_http_client = None
+_limiter = None
+_clients: Dict[Tuple[str, float], LLMClient] = {}
+_clients_lock = threading.Lock()
+_offline_client = OfflineLLMClient()
+
+
+def get_llm_client(model: str = "gpt-3.5-turbo", temperature: float = 0) -> ChatClient:
+    """
+    Get the shared client for the given model and temperature, or the offline
+    stand-in when LLM_PROVIDER is "offline".
+    """
+    if LLM_PROVIDER == "offline":
+        return _offline_client
+
+    global _http_client, _limiter
+    with _clients_lock:
+        if _http_client is None:
+            import httpx
+
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=10.0),
+            )
+            _limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+
+        key = (model, float(temperature))
+        client = _clients.get(key)
+        if client is None:
+            client = LLMClient(model, temperature, _limiter, _http_client)
+            _clients[key] = client
+        return client
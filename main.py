@@ -1,21 +1,31 @@
+import time
+_script_start = time.perf_counter()
+
 import streamlit as st
 from dotenv import load_dotenv
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import text
 from database import engine, SessionLocal,PYQ
-from utils import extract_text_from_pdf
-from rag_pipeline import get_relevant_pyqs
+from warmup import start_warmup, record_timing, get_timings
+from jobs import (job_id_for, get_job, get_job_pages, get_job_previews, get_job_stats,
+                  count_outstanding_answers, submit_job)
+from latency_budget import PAGE_LATENCY_BUDGET_SECONDS, UPLOAD_LATENCY_BUDGET_SECONDS
+import os
 import tempfile
+import uuid
 import datetime
-import fitz  # PyMuPDF
-from PIL import Image
 from io import BytesIO
-from nltk.tokenize import sent_tokenize
-from langchain.chat_models import ChatOpenAI
+
+# PyMuPDF, PIL, NLTK and the LangChain/FAISS pipeline are imported once a PDF
+# is actually processed, so the first paint does not wait for them.
 
 st.set_page_config(page_title="IntelliJect", layout="wide")
 st.title("🧠 IntelliJect: Intelligent Integration of PYQ's into Notes")
 
+# Modules stay imported across Streamlit reruns, so only the first run measures real import cost
+if "app imports" not in get_timings():
+    record_timing("app imports", time.perf_counter() - _script_start)
+
 st.markdown("""
     <style>
     .question-card {
@@ -54,26 +64,6 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-def extract_answer_from_chunk(chunk, question):
-    prompt = f"""
-Given the following notes and a question, extract the exact sentence(s) from the notes that directly answer the question if possible. Only return the excerpt(s), not any explanation.
-
-Notes:
-\"\"\"{chunk}\"\"\"
-
-Question:
-\"\"\"{question}\"\"\"
-
-Answer/excerpt:
-"""
-    try:
-        llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo")
-        answer = llm.predict(prompt).strip()
-        return answer
-    except Exception as e:
-        st.error(f"Error extracting answer: {e}")
-        return ""
-
 # Test database connection function
 def test_database_connection():
     try:
@@ -99,39 +89,188 @@ with st.sidebar:
         st.error(f"❌ {db_message}")
         st.markdown(f"<div class='error-box'>Database connection failed. Please check your database configuration.</div>", unsafe_allow_html=True)
 
+    # Preload subject indexes and NLTK data in the background (once per process)
+    if db_status:
+        start_warmup()
+
+    with st.expander("⏱️ Latency budget"):
+        page_budget = st.number_input("Seconds per page (0 = no limit)", min_value=0.0,
+                                      value=PAGE_LATENCY_BUDGET_SECONDS, step=1.0,
+                                      help="Pages are shown after this long; slower answers are filled in later.")
+        upload_budget = st.number_input("Seconds per upload (0 = no limit)", min_value=0.0,
+                                        value=UPLOAD_LATENCY_BUDGET_SECONDS, step=10.0,
+                                        help="Once used up, pages only show retrieved PYQs and cached answers.")
+
+    timings = get_timings()
+    if timings:
+        with st.expander("⏱️ Startup timings"):
+            for name, seconds in timings.items():
+                st.caption(f"{name}: {seconds:.2f}s")
+
 col1, col2 = st.columns(2)
 with col1:
     uploaded_file = st.file_uploader("📑 Upload your notes PDF", type=["pdf"])
 with col2:
     subject = st.selectbox("📚 Select Subject", ["Cyber Security", "Environmental Sciences","Probability and Statistics"])
 
+view_mode = st.radio("👀 View mode", ["Paginated viewer", "Full document"], horizontal=True,
+                     help="The paginated viewer only matches the pages you look at (plus a few ahead).")
+
 # Only show button if database is connected
 if not db_status:
     st.error("❌ Cannot proceed - database connection failed. Please check your database setup.")
     st.stop()
 
+# Seconds between refreshes while a background job is still running,
+# and while answer text is streaming into a visible page
+POLL_SECONDS = 1.0
+STREAM_POLL_SECONDS = 0.25
+# Paginated viewer: pages shown at once, and pages matched ahead of them
+PAGES_PER_VIEW = 2
+PREFETCH_PAGES = 2
+
+# Identifies this browser session to the shared job (its pages and latency budget)
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+
+job_id = None
 if uploaded_file and subject:
+    # Same PDF + subject -> same job, so reruns and reconnects reattach to it
+    job_id = job_id_for(uploaded_file.getvalue(), subject)
     match_button = st.button("🔍 Match PYQs", type="primary", use_container_width=True)
     
-    if not match_button:
+    if not match_button and get_job(job_id) is None:
         st.info("👆 Click 'Match PYQs' to process your PDF and find relevant questions.")
         st.stop()
 
+def _answer_label(result, idx, answer_text, answers_arriving):
+    if idx in result.get("streaming", []):
+        return f"{answer_text} ▌" if answer_text else "⏳ Answer pending..."
+    if answer_text:
+        return answer_text
+    if answer_text is None and idx in result.get("skipped", []):
+        return "(Skipped — latency budget used up)"
+    if answer_text is None and idx in result.get("failed", []):
+        return "(Answer failed — click 'Match PYQs' to retry)"
+    if answer_text is None:
+        return "⏳ Answer pending..." if answers_arriving else "(Answer not available — timed out)"
+    return "(No direct answer found)"
+
+def render_page_results(result, answers_arriving=False):
+    """
+    Render the subtopic and question cards of a processed page.
+    answers_arriving tells whether late answers are still being computed.
+    """
+    if result.get("error"):
+        st.error(f"❌ {result['error']} — click 'Match PYQs' to retry")
+
+    if result.get("reused_from") == "store":
+        st.caption("♻️ Near-duplicate of a previously processed page — reusing its matches")
+    elif result.get("reused_from"):
+        st.caption(f"♻️ Near-duplicate of page {result['reused_from']} — reusing its matches")
+
+    subtopic = result["subtopic"]
+    if result["matches"]:
+        st.markdown(
+            f"<span style='font-size:18px;font-weight:bold;'>🔎 Subtopic: "
+            f"<span class='database-subtopic'>{subtopic}</span></span>", 
+            unsafe_allow_html=True
+        )
+        for idx, (q, answer_text) in enumerate(zip(result["matches"], result["answers"])):
+            answer_label = _answer_label(result, idx, answer_text, answers_arriving)
+            st.markdown(
+                f"<div class='question-card'>"
+                f"❓ <b>Q{idx+1}:</b> {q['question']}<br>"
+                f"<span style='font-size:14px;opacity:0.8;'>"
+                f"🧩 Topic: {q.get('sub_topic') or 'N/A'} | "
+                f"📝 Marks: {q.get('marks') or 'N/A'} | "
+                f"📅 {q.get('year') or 'N/A'}"
+                f"</span><br>"
+                f"<span class='highlight-answer'><b>📌 Answer:</b> {answer_label}</span>"
+                f"</div>", unsafe_allow_html=True
+            )
+            st.markdown("---", unsafe_allow_html=True)
+    else:
+        st.markdown(
+            f"<span style='font-size:18px;font-weight:bold;'>🔎 Subtopic: {subtopic}</span>", 
+            unsafe_allow_html=True
+        )
+        st.info("❗ No relevant PYQs found for this chunk.")
+
+def render_highlighted_page(pdf_doc, i, answers):
+    """
+    Highlight the answer sentences on PDF page i and return (PNG bytes, highlight count).
+    """
+    from nltk.tokenize import sent_tokenize
+
+    answers_to_highlight = []
+    for answer_text in answers:
+        if answer_text:
+            for sent in sent_tokenize(answer_text):
+                sent_clean = sent.strip()
+                if sent_clean:
+                    answers_to_highlight.append(sent_clean)
+
+    page = pdf_doc[i]
+
+    # RESTORED PDF HIGHLIGHTING FUNCTIONALITY
+    highlight_count = 0
+    
+    # Highlight answer text on the PDF page
+    for answer_frag in answers_to_highlight:
+        if answer_frag and len(answer_frag.strip()) > 3:  # Only highlight meaningful text
+            try:
+                # Search for the text fragment on the page
+                rects = page.search_for(answer_frag)
+                if rects:  # Only proceed if text found on page
+                    for rect in rects:
+                        # Add yellow highlight annotation
+                        annot = page.add_highlight_annot(rect)
+                        annot.set_colors(stroke=(1, 1, 0))  # Yellow highlight
+                        annot.update()
+                        highlight_count += 1
+            except Exception as highlight_error:
+                # Continue if specific text can't be highlighted
+                pass
+
+    # Convert highlighted page to image
+    pix = page.get_pixmap(dpi=150)
+    return pix.pil_tobytes(format="PNG"), highlight_count
+
 if uploaded_file and subject:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        tmp_file.write(uploaded_file.read())
-        tmp_pdf_path = tmp_file.name
+    processing_start = time.perf_counter()
+    import fitz  # PyMuPDF
+    from PIL import Image
+    from utils import extract_text_from_pdf
+    if "lazy imports" not in get_timings():
+        record_timing("lazy imports", time.perf_counter() - processing_start)
+
+    # Text extraction and the subject check run once per upload; polling reruns reuse them
+    upload = st.session_state.get("upload")
+    if upload is not None and upload["job_id"] != job_id:
+        upload = None
 
     # Simple file info display (no database saving)
     st.success(f"✅ PDF '{uploaded_file.name}' loaded for processing.")
 
     st.subheader("📑 Extracting and Chunking Notes...")
     
-    try:
-        text_chunks = extract_text_from_pdf(tmp_pdf_path)
-    except Exception as e:
-        st.error(f"❌ Could not extract content from PDF: {e}")
-        st.stop()
+    if upload is None:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+            tmp_file.write(uploaded_file.getvalue())
+            tmp_pdf_path = tmp_file.name
+
+        try:
+            text_chunks = extract_text_from_pdf(tmp_pdf_path)
+        except Exception as e:
+            st.error(f"❌ Could not extract content from PDF: {e}")
+            st.stop()
+        finally:
+            try:
+                os.unlink(tmp_pdf_path)
+            except OSError:
+                pass
+    else:
+        text_chunks = upload["chunks"]
 
     if not text_chunks:
         st.error("❌ Could not extract content from the PDF.")
@@ -140,26 +279,37 @@ if uploaded_file and subject:
         st.success(f"✅ Successfully extracted {len(text_chunks)} chunks.")
 
         # Test subject data availability
-        try:
-            with SessionLocal() as db:
-                subject_count = db.query(PYQ).filter(PYQ.subject == subject).count()
-                if subject_count == 0:
-                    st.error(f"❌ No PYQs found for subject '{subject}' in database.")
-                    
-                    # Show available subjects for debugging
-                    available_subjects = db.execute(text("SELECT DISTINCT subject FROM pyqs")).fetchall()
-                    if available_subjects:
-                        subjects_list = [subj[0] for subj in available_subjects]
-                        st.info(f"Available subjects in database: {', '.join(subjects_list)}")
-                    st.stop()
-                else:
-                    st.info(f"📚 Found {subject_count} PYQs for subject: {subject}")
-        except Exception as e:
-            st.error(f"❌ Could not check subject data: {e}")
-            st.stop()
+        if upload is not None:
+            st.info(f"📚 Found {upload['subject_count']} PYQs for subject: {subject}")
+        else:
+            try:
+                with SessionLocal() as db:
+                    subject_count = db.query(PYQ).filter(PYQ.subject == subject).count()
+                    if subject_count == 0:
+                        st.error(f"❌ No PYQs found for subject '{subject}' in database.")
+                        
+                        # Show available subjects for debugging
+                        available_subjects = db.execute(text("SELECT DISTINCT subject FROM pyqs")).fetchall()
+                        if available_subjects:
+                            subjects_list = [subj[0] for subj in available_subjects]
+                            st.info(f"Available subjects in database: {', '.join(subjects_list)}")
+                        st.stop()
+                    else:
+                        st.info(f"📚 Found {subject_count} PYQs for subject: {subject}")
+            except Exception as e:
+                st.error(f"❌ Could not check subject data: {e}")
+                st.stop()
+            # Only the current upload is kept, so session memory does not grow with each PDF
+            st.session_state["upload"] = {"job_id": job_id, "chunks": text_chunks, "subject_count": subject_count}
+            # Rendered pages and request state of earlier uploads go with them
+            st.session_state["page_images"] = {
+                key: image for key, image in st.session_state.get("page_images", {}).items() if key[0] == job_id
+            }
+            for key in ("submitted_requests", "job_started"):
+                st.session_state[key] = {j: v for j, v in st.session_state.get(key, {}).items() if j == job_id}
 
         try:
-            pdf_doc = fitz.open(tmp_pdf_path)
+            pdf_doc = fitz.open(stream=uploaded_file.getvalue(), filetype="pdf")
             num_pages = pdf_doc.page_count
         except Exception as e:
             st.error(f"❌ Could not open PDF with PyMuPDF: {e}")
@@ -168,97 +318,110 @@ if uploaded_file and subject:
         if len(text_chunks) != num_pages:
             st.warning(f"⚠️ Number of text chunks ({len(text_chunks)}) does not match number of PDF pages ({num_pages}). Highlighting may be inaccurate.")
 
+        total_pages = len(text_chunks)
+        if view_mode == "Paginated viewer":
+            first_page = st.number_input("📄 Go to page", min_value=1, max_value=total_pages,
+                                         value=1, step=PAGES_PER_VIEW) - 1
+            visible_pages = list(range(first_page, min(first_page + PAGES_PER_VIEW, total_pages)))
+            next_page = visible_pages[-1] + 1
+            requested_pages = visible_pages + list(range(next_page, min(next_page + PREFETCH_PAGES, total_pages)))
+        else:
+            visible_pages = list(range(total_pages))
+            requested_pages = None
+
+        # Matching runs in a background worker; this run only renders what is finished so far
+        job = get_job(job_id)
+        if match_button:
+            st.session_state.setdefault("job_started", {})[job_id] = time.perf_counter()
+        # Unfinished jobs are resubmitted when the requested window or budget changes;
+        # this resumes them after a server restart and follows the paginated viewer.
+        # Polling reruns with an unchanged request do not touch the job.
+        submitted = st.session_state.setdefault("submitted_requests", {})
+        request = (tuple(requested_pages) if requested_pages is not None else None, page_budget, upload_budget)
+        if match_button or job is None or (
+            job["status"] in ("queued", "running", "paused") and submitted.get(job_id) != request
+        ):
+            submit_job(job_id, subject, uploaded_file.name, text_chunks, requested_pages,
+                       page_budget, upload_budget, requester=session_id)
+            submitted[job_id] = request
+            job = get_job(job_id)
+
+        page_results = get_job_pages(job_id)
+        st.progress(len(page_results) / total_pages,
+                    text=f"Processed {len(page_results)} of {total_pages} pages")
+        if job["status"] == "failed":
+            st.error(f"❌ Matching failed: {job['error']}")
+
+        budget_stats = get_job_stats(job_id, session_id)
+        # Late answers may belong to pages another session of the same job requested
+        answers_arriving = count_outstanding_answers(job_id) > 0
+        if budget_stats and (budget_stats["timeouts"] or budget_stats["cancellations"]):
+            st.caption(
+                f"⏱️ Latency budget: {budget_stats['timeouts']} answers timed out "
+                f"({budget_stats['late_answers']} filled in later, {budget_stats['outstanding']} still pending), "
+                f"{budget_stats['cancellations']} cancelled"
+            )
+
+        # Highlighted page images are rendered once per job, page and set of answers, not on every poll.
+        # Only the latest image per page is kept, so late answers do not pile up old PNGs.
+        page_images = st.session_state.setdefault("page_images", {})
+
+        # Pages whose answers are still streaming in are shown from their latest snapshot
+        previews = get_job_previews(job_id)
+        streaming_visible = False
+
         # Process chunks
-        for i, chunk in enumerate(text_chunks):  # Process ALL chunks
+        for i in visible_pages:
+            chunk = text_chunks[i]
+            preview = previews.get(i)
+            if i not in page_results and preview is None:
+                st.info(f"⏳ Processing page {i+1}...")
+                break
+
+            result = page_results.get(i)
+            if result is None:
+                # Cards are shown right away; the page is highlighted once its answers are complete
+                display, highlight_answers = preview, []
+            elif preview is not None:
+                # Persisted with late answers outstanding; show their text so far
+                display = dict(
+                    result,
+                    answers=[a if a is not None else preview["answers"][k] for k, a in enumerate(result["answers"])],
+                    streaming=[k for k in preview["streaming"] if result["answers"][k] is None],
+                )
+                highlight_answers = result["answers"]
+            else:
+                display, highlight_answers = result, result["answers"]
+            streaming_visible = streaming_visible or bool(display.get("streaming"))
+
             col_img, col_pyqs = st.columns([1.5, 1])
-            answers_to_highlight = []
 
             with col_pyqs:
                 st.markdown(f"### 📄 Page {i+1}")
-                
-                try:
-                    with SessionLocal() as session:
-                        related_qs = get_relevant_pyqs(session, chunk, subject)
-                        
-                        if related_qs:
-                            subtopic = related_qs[0].metadata.get('sub_topic', 'General')
-                            st.markdown(
-                                f"<span style='font-size:18px;font-weight:bold;'>🔎 Subtopic: "
-                                f"<span class='database-subtopic'>{subtopic}</span></span>", 
-                                unsafe_allow_html=True
-                            )
-                        else:
-                            subtopic = "No matches found"
-                            st.markdown(
-                                f"<span style='font-size:18px;font-weight:bold;'>🔎 Subtopic: {subtopic}</span>", 
-                                unsafe_allow_html=True
-                            )
-                            
-                except Exception as e:
-                    st.error(f"❌ Database query failed: {e}")
-                    related_qs = []
-
-                if related_qs:
-                    for idx, q in enumerate(related_qs[:3]):  # Limit to 3 questions per chunk
-                        answer_text = extract_answer_from_chunk(chunk, q.page_content)
-                        if answer_text:
-                            for sent in sent_tokenize(answer_text):
-                                sent_clean = sent.strip()
-                                if sent_clean:
-                                    answers_to_highlight.append(sent_clean)
-
-                        st.markdown(
-                            f"<div class='question-card'>"
-                            f"❓ <b>Q{idx+1}:</b> {q.page_content}<br>"
-                            f"<span style='font-size:14px;opacity:0.8;'>"
-                            f"🧩 Topic: {q.metadata.get('sub_topic', 'N/A')} | "
-                            f"📝 Marks: {q.metadata.get('marks', 'N/A')} | "
-                            f"📅 {q.metadata.get('year', 'N/A')}"
-                            f"</span><br>"
-                            f"<span class='highlight-answer'><b>📌 Answer:</b> {answer_text if answer_text else '(No direct answer found)'}</span>"
-                            f"</div>", unsafe_allow_html=True
-                        )
-                        st.markdown("---", unsafe_allow_html=True)
-                else:
-                    st.info("❗ No relevant PYQs found for this chunk.")
+                render_page_results(display, answers_arriving)
+
+            if i == visible_pages[0] and job_id in st.session_state.get("job_started", {}):
+                record_timing("time to first result", time.perf_counter() - st.session_state["job_started"].pop(job_id))
 
             with col_img:
                 try:
                     if i >= num_pages:
                         st.warning(f"Chunk index {i} out of PDF pages range ({num_pages}). Skipping highlighting.")
                         continue
-                        
-                    page = pdf_doc[i]
 
-                    # RESTORED PDF HIGHLIGHTING FUNCTIONALITY
-                    highlight_count = 0
-                    
-                    # Highlight answer text on the PDF page
-                    for answer_frag in answers_to_highlight:
-                        if answer_frag and len(answer_frag.strip()) > 3:  # Only highlight meaningful text
-                            try:
-                                # Search for the text fragment on the page
-                                rects = page.search_for(answer_frag)
-                                if rects:  # Only proceed if text found on page
-                                    for rect in rects:
-                                        # Add yellow highlight annotation
-                                        annot = page.add_highlight_annot(rect)
-                                        annot.set_colors(stroke=(1, 1, 0))  # Yellow highlight
-                                        annot.update()
-                                        highlight_count += 1
-                            except Exception as highlight_error:
-                                # Continue if specific text can't be highlighted
-                                pass
-
-                    # Convert highlighted page to image
-                    pix = page.get_pixmap(dpi=150)
-                    img_data = pix.pil_tobytes(format="PNG")
+                    cached = page_images.get((job_id, i))
+                    if cached is None or cached[0] != tuple(highlight_answers):
+                        cached = (tuple(highlight_answers), *render_highlighted_page(pdf_doc, i, highlight_answers))
+                        page_images[(job_id, i)] = cached
+                    _, img_data, highlight_count = cached
                     img = Image.open(BytesIO(img_data))
                     
                     # Display with highlight count
                     st.image(img, caption=f"PDF Page {i+1} ({highlight_count} highlights)", use_container_width=True)
                     
-                    if highlight_count > 0:
+                    if result is None:
+                        st.info("✍️ Answers are streaming in — highlights appear once they are complete")
+                    elif highlight_count > 0:
                         st.success(f"✨ {highlight_count} answer segments highlighted on this page")
                     else:
                         st.info("💡 No answer text found on this page to highlight")
@@ -273,7 +436,15 @@ if uploaded_file and subject:
         # Clean up
         try:
             pdf_doc.close()
-            import os
-            os.unlink(tmp_pdf_path)
         except:
             pass
+
+        # Keep polling until the background job has finished every visible page
+        # and late answers for them are no longer arriving
+        pages_missing = any(i not in page_results for i in visible_pages)
+        answers_missing = answers_arriving and any(
+            None in page_results[i]["answers"] for i in visible_pages if i in page_results
+        )
+        if job["status"] != "failed" and (pages_missing or answers_missing or streaming_visible):
+            time.sleep(STREAM_POLL_SECONDS if streaming_visible else POLL_SECONDS)
+            st.rerun()
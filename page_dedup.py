@@ -0,0 +1,117 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+FINGERPRINT_BITS = 64
+# Pages whose fingerprints differ in at most this many bits count as near-duplicates
+MAX_HAMMING_DISTANCE = 7
+# The fingerprint is split into MAX_HAMMING_DISTANCE + 1 bands. Two fingerprints
+# within the distance limit must agree exactly on at least one band, so only
+# pages sharing a band have to be compared.
+_BANDS = MAX_HAMMING_DISTANCE + 1
+_BAND_BITS = FINGERPRINT_BITS // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+SHINGLE_SIZE = 3
+
+# Pages kept per subject in the process-wide result store
+MAX_STORED_PAGES = 5000
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_page_text(text: str) -> List[str]:
+    """Lowercase word tokens of the page text."""
+    return _WORD_RE.findall(text.lower())
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of the page text over word shingles.
+    Pages that differ by a few words get fingerprints a few bits apart.
+    """
+    words = normalize_page_text(text)
+    if len(words) >= SHINGLE_SIZE:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    else:
+        shingles = [" ".join(words)]
+
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateIndex:
+    """
+    Maps page fingerprints to stored results and finds entries within
+    MAX_HAMMING_DISTANCE bits. Oldest entries are evicted past max_entries.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Any]" = OrderedDict()
+        self._bands: List[Dict[int, set]] = [{} for _ in range(_BANDS)]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _band_keys(fingerprint: int) -> List[int]:
+        return [(fingerprint >> (b * _BAND_BITS)) & _BAND_MASK for b in range(_BANDS)]
+
+    def find(self, fingerprint: int) -> Optional[Any]:
+        """Return the stored value of the closest near-duplicate, or None."""
+        with self._lock:
+            candidates = set()
+            for band, key in zip(self._bands, self._band_keys(fingerprint)):
+                candidates |= band.get(key, set())
+
+            best, best_distance = None, MAX_HAMMING_DISTANCE + 1
+            for candidate in candidates:
+                distance = hamming_distance(fingerprint, candidate)
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+            return self._entries[best] if best is not None else None
+
+    def add(self, fingerprint: int, value: Any):
+        with self._lock:
+            if fingerprint not in self._entries:
+                for band, key in zip(self._bands, self._band_keys(fingerprint)):
+                    band.setdefault(key, set()).add(fingerprint)
+            self._entries[fingerprint] = value
+            self._entries.move_to_end(fingerprint)
+
+            if self.max_entries is not None and len(self._entries) > self.max_entries:
+                old, _ = self._entries.popitem(last=False)
+                for band, key in zip(self._bands, self._band_keys(old)):
+                    band[key].discard(old)
+                    if not band[key]:
+                        del band[key]
+
+
+_result_stores: Dict[str, NearDuplicateIndex] = {}
+_result_stores_lock = threading.Lock()
+
+
+def get_result_store(subject: str) -> NearDuplicateIndex:
+    """
+    Process-wide store of processed page results for a subject, shared by all
+    sessions so repeated slides in later uploads are reused too.
+    """
+    with _result_stores_lock:
+        store = _result_stores.get(subject)
+        if store is None:
+            store = NearDuplicateIndex(max_entries=MAX_STORED_PAGES)
+            _result_stores[subject] = store
+        return store
@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from database import SessionLocal
+from latency_budget import LatencyBudget
+from page_dedup import NearDuplicateIndex, get_result_store, simhash
+
+# Questions shown (and answered) per page
+MAX_QUESTIONS_PER_PAGE = 3
+# Answer extractions running at once across all uploads
+ANSWER_WORKERS = int(os.getenv("ANSWER_WORKERS", "8"))
+# Retrievals (embedding request + search) running at once across all uploads
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+
+_answer_executor = ThreadPoolExecutor(max_workers=ANSWER_WORKERS, thread_name_prefix="intelliject-answer")
+_retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="intelliject-retrieval")
+
+
+def _match_to_dict(doc) -> Dict:
+    return {
+        "question": doc.page_content,
+        "sub_topic": doc.metadata.get("sub_topic"),
+        "marks": doc.metadata.get("marks"),
+        "year": doc.metadata.get("year"),
+    }
+
+
+def search_upload(chunks: List[str], subject: str, shown: Optional[Dict[int, int]] = None) -> List[Tuple[str, List]]:
+    """
+    Retrieve (subtopic, matches) for several pages in one batch with the
+    configured backend. shown carries the "exact" backend's spreading state
+    across batches of the same upload (see rag_pipeline.search_pages).
+    """
+    from rag_pipeline import search_pages
+
+    with SessionLocal() as session:
+        return search_pages(session, chunks, subject, k=MAX_QUESTIONS_PER_PAGE, shown=shown)
+
+
+def start_search(chunks: List[str], subject: str, shown: Optional[Dict[int, int]] = None) -> List[Future]:
+    """
+    Run search_upload for the pages in the background. Returns one Future per
+    page resolving to its (subtopic, matches), so each page waits for the
+    shared batch only until its own deadline.
+    """
+    batch = _retrieval_executor.submit(search_upload, chunks, subject, shown)
+    pages = [Future() for _ in chunks]
+
+    def split(done: Future):
+        try:
+            results = done.result()
+        except Exception as e:
+            for page in pages:
+                page.set_exception(e)
+        else:
+            for page, result in zip(pages, results):
+                page.set_result(result)
+
+    batch.add_done_callback(split)
+    return pages
+
+
+def match_page(chunk: str, subject: str, retrieved: Union[Tuple[str, List], Future, None] = None,
+               budget: Optional[LatencyBudget] = None,
+               on_update: Optional[Callable[[Dict], None]] = None) -> Tuple[Dict, Dict[int, Future]]:
+    """
+    Retrieve the PYQs for one page and extract their answers.
+    retrieved is an already computed (subtopic, matches) pair from search_upload,
+    or a Future of one from start_search.
+
+    With a budget, retrieval and answers are only awaited until the page
+    deadline. Retrieval still running then raises TimeoutError (it finishes
+    in the background; the page can be requested again). Answers
+    still running then are None in the result and returned as {index: Future}
+    so the caller can fill them in later; when the upload budget is used up,
+    answers not yet started are cancelled and listed under "skipped".
+    Answers whose LLM call failed are None and listed under "failed".
+
+    With on_update, answers are streamed: on_update receives a snapshot of the
+    page (matches, answer text so far, indexes still "streaming") as soon as
+    the PYQs are retrieved and again whenever answer text arrives, including
+    for answers that finish after the deadline.
+    Returns (JSON-serializable dict with subtopic, matches, answers, skipped, failed; outstanding futures).
+    """
+    from answer_extractor import extract_answer_from_chunk, get_cached_answer
+
+    start = time.perf_counter()
+    deadline = budget.page_deadline() if budget is not None else None
+
+    if retrieved is None:
+        retrieved = start_search([chunk], subject)[0]
+    if isinstance(retrieved, Future):
+        search = retrieved
+        wait([search], timeout=deadline.remaining() if deadline is not None else None)
+        if not search.done():
+            budget.charge(time.perf_counter() - start)
+            budget.record(timeouts=1)
+            raise TimeoutError("Retrieval did not finish within the page's latency budget")
+        retrieved = search.result()
+    subtopic, docs = retrieved
+
+    matches = [_match_to_dict(doc) for doc in docs[:MAX_QUESTIONS_PER_PAGE]]
+    answers = [get_cached_answer(chunk, m["question"]) for m in matches]
+    missing = [idx for idx, answer in enumerate(answers) if answer is None]
+
+    futures, skipped, failed, outstanding = {}, [], [], {}
+    if budget is not None and budget.upload_exhausted():
+        # Nothing left to spend: show retrieved PYQs with cached answers only
+        skipped = missing
+    elif missing and on_update is None:
+        futures = {idx: _answer_executor.submit(extract_answer_from_chunk, chunk, matches[idx]["question"])
+                   for idx in missing}
+    elif missing:
+        live = list(answers)
+        streaming = set(missing)
+        lock = threading.Lock()
+
+        def publish(idx: int, text: str, finished: bool = False):
+            # Published under the lock so snapshots reach on_update in order
+            with lock:
+                live[idx] = text
+                if finished:
+                    streaming.discard(idx)
+                on_update({"subtopic": subtopic, "matches": matches, "answers": list(live),
+                           "streaming": sorted(streaming)})
+
+        def extract(idx: int) -> str:
+            answer = extract_answer_from_chunk(chunk, matches[idx]["question"],
+                                               on_text=lambda text: publish(idx, text))
+            publish(idx, answer, finished=True)
+            return answer
+
+        on_update({"subtopic": subtopic, "matches": matches, "answers": list(live), "streaming": missing})
+        futures = {idx: _answer_executor.submit(extract, idx) for idx in missing}
+    if futures:
+        wait(futures.values(), timeout=deadline.remaining() if deadline is not None else None)
+    if budget is not None:
+        budget.charge(time.perf_counter() - start)
+
+    for idx, future in futures.items():
+        if future.done():
+            answers[idx] = future.result()
+            if answers[idx] is None:
+                failed.append(idx)
+        elif budget.upload_exhausted() and future.cancel():
+            skipped.append(idx)
+        else:
+            outstanding[idx] = future
+    if budget is not None:
+        budget.record(timeouts=len(outstanding), outstanding=len(outstanding), cancellations=len(skipped))
+    return {"subtopic": subtopic, "matches": matches, "answers": answers, "skipped": skipped,
+            "failed": failed}, outstanding
+
+
+def remember_page(chunk: str, subject: str, result: Dict,
+                  upload_pages: Optional[NearDuplicateIndex] = None, fingerprint: Optional[int] = None):
+    """
+    Offer a processed page for near-duplicate reuse, in the upload's index and
+    the subject's result store. Pages still waiting for answers are skipped;
+    call again once their late answers are filled in.
+    """
+    if None in result["answers"]:
+        return
+    fingerprint = simhash(chunk) if fingerprint is None else fingerprint
+    get_result_store(subject).add(fingerprint, result)
+    if upload_pages is not None:
+        upload_pages.add(fingerprint, result)
+
+
+def process_page(chunk: str, subject: str, page_index: int,
+                 upload_pages: Optional[NearDuplicateIndex] = None,
+                 retrieved: Union[Tuple[str, List], Future, None] = None,
+                 budget: Optional[LatencyBudget] = None,
+                 on_update: Optional[Callable[[Dict], None]] = None) -> Tuple[Dict, Dict[int, Future]]:
+    """
+    Process one page, reusing the result of a near-duplicate page from the same
+    upload or from the subject's result store when there is one.
+    The result records the page it was reused from (if any) under "reused_from".
+    Returns (result, outstanding answer futures), see match_page.
+    """
+    fingerprint = simhash(chunk)
+    result_store = get_result_store(subject)
+    page = page_index + 1
+
+    earlier = upload_pages.find(fingerprint) if upload_pages is not None else None
+    stored = result_store.find(fingerprint) if earlier is None else None
+    outstanding = {}
+    if earlier is not None:
+        result = dict(earlier, page=page, reused_from=earlier["page"])
+    elif stored is not None:
+        result = dict(stored, page=page, reused_from="store")
+    else:
+        try:
+            result, outstanding = match_page(chunk, subject, retrieved, budget, on_update)
+            result = dict(result, page=page, reused_from=None)
+        except Exception as e:
+            error = str(e) if isinstance(e, TimeoutError) else f"Database query failed: {e}"
+            return {"page": page, "subtopic": "No matches found", "matches": [], "answers": [],
+                    "reused_from": None, "error": error}, {}
+        remember_page(chunk, subject, result, upload_pages, fingerprint)
+        return result, outstanding
+
+    if upload_pages is not None and earlier is None:
+        upload_pages.add(fingerprint, result)
+    return result, outstanding
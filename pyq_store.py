@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from database import PYQ
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# Stored in the year column when a PYQ has no year
+MISSING_YEAR = -1
+
+
+def _intern(values: Sequence[Optional[str]]) -> Tuple[np.ndarray, List[Optional[str]]]:
+    """Replace repeated strings by small integer codes into a label list."""
+    codes: Dict[Optional[str], int] = {}
+    column = np.fromiter((codes.setdefault(v, len(codes)) for v in values), dtype=np.int32, count=len(values))
+    return column, list(codes)
+
+
+class PYQColumns:
+    """
+    Compact column-oriented copy of a set of PYQs: all question text in one
+    UTF-8 buffer with offsets, year/marks as NumPy arrays and subject/sub_topic
+    as interned codes. LangChain Documents are only created for returned rows.
+    """
+
+    def __init__(self, questions: Sequence[str], subjects: Sequence[Optional[str]],
+                 sub_topics: Sequence[Optional[str]], years: Sequence[Optional[int]],
+                 marks: Sequence[Optional[float]]):
+        encoded = [q.encode("utf-8") for q in questions]
+        self._buffer = b"".join(encoded)
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(q) for q in encoded], out=self.offsets[1:])
+
+        self.years = np.array([MISSING_YEAR if y is None else y for y in years], dtype=np.int32)
+        self.marks = np.array([np.nan if m is None else m for m in marks], dtype=np.float32)
+        self.subject_codes, self.subject_labels = _intern(subjects)
+        self.sub_topic_codes, self.sub_topic_labels = _intern(sub_topics)
+
+    @classmethod
+    def load(cls, session: Session, subject: str = None) -> Optional[PYQColumns]:
+        """
+        Load the PYQs of a subject (all subjects if None) with one column-only
+        query. Returns None when there are no PYQs.
+        """
+        query = session.query(PYQ.question, PYQ.subject, PYQ.sub_topic, PYQ.year, PYQ.marks)
+        if subject:
+            query = query.filter(PYQ.subject == subject)
+
+        rows = query.all()
+        if not rows:
+            return None
+        return cls(*zip(*rows))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns."""
+        return (len(self._buffer) + self.offsets.nbytes + self.years.nbytes + self.marks.nbytes
+                + self.subject_codes.nbytes + self.sub_topic_codes.nbytes)
+
+    def question(self, row: int) -> str:
+        return self._buffer[self.offsets[row]:self.offsets[row + 1]].decode("utf-8")
+
+    def questions(self) -> Iterator[str]:
+        for row in range(len(self)):
+            yield self.question(row)
+
+    def sub_topic(self, row: int) -> Optional[str]:
+        return self.sub_topic_labels[self.sub_topic_codes[row]]
+
+    def metadata(self, row: int) -> Dict:
+        year = int(self.years[row])
+        marks = float(self.marks[row])
+        return {
+            "year": None if year == MISSING_YEAR else year,
+            "subject": self.subject_labels[self.subject_codes[row]],
+            "sub_topic": self.sub_topic(row),
+            "marks": None if np.isnan(marks) else marks,
+        }
+
+    def documents(self, rows: Sequence[int]) -> List[Document]:
+        """Materialize LangChain Documents for the given rows only."""
+        from langchain_core.documents import Document
+
+        return [Document(page_content=self.question(r), metadata=self.metadata(r)) for r in rows]
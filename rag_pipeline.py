@@ -1,86 +1,255 @@
+from __future__ import annotations
+
 import os
-from typing import List
+import threading
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+import numpy as np
 from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database import PYQ
+from llm_client import LLM_PROVIDER, REQUEST_TIMEOUT_SECONDS, OfflineEmbeddings
+from pyq_store import PYQColumns
+from subtopic_router import SubtopicRouter, DEFAULT_SUBTOPIC
+from vector_search import PYQMatrixIndex
+
+# LangChain, FAISS and the OpenAI client are heavy to import, so they are only
+# loaded on first use. The names below are for type hints only.
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
 
 load_dotenv()
 
-# Get OpenAI API key from environment variables
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# How pages are matched to PYQs (search_pages and get_relevant_pyqs):
+#   "routed" - route the page to its nearest sub_topic centroids, exact search within them
+#   "exact"  - exact cosine search over all PYQs, with MMR and spreading across pages
+#   "faiss"  - FAISS flat L2 search over all PYQs
+RETRIEVAL_BACKENDS = ("routed", "exact", "faiss")
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "routed")
+# "exact" backend: MMR trade-off (1.0 = pure relevance) and per-repeat penalty
+# for PYQs already shown on earlier pages of the same upload
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+SPREAD_PENALTY = float(os.getenv("SPREAD_PENALTY", "0.05"))
+# Retries of a failed embeddings request; with the request timeout this bounds
+# how long retrieval can hold up a page
+EMBEDDING_MAX_RETRIES = 1
 
-# Validate API key exists
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY not found in environment variables. Please check your .env file.")
+_embedding = None
+_embedding_lock = threading.Lock()
 
-# Set OpenAI API key for LangChain
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+# Built indexes per subject (None = all subjects), reused across requests
+# until the subject's PYQs change
+_indexes: Dict[str, SubjectIndex] = {}
+_index_locks: Dict[str, threading.Lock] = {}
+_indexes_lock = threading.Lock()
 
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_community.vectorstores import FAISS
-from langchain_core.documents import Document
-from sqlalchemy.orm import Session
-from database import PYQ
-embedding = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
 
-def load_vectorstore_from_db(session: Session, subject: str = None) -> FAISS:
+def get_embedding():
+    """
+    Create the OpenAI embeddings client on first use
+    (the local stand-in when LLM_PROVIDER is "offline").
+    """
+    global _embedding
+    with _embedding_lock:
+        if _embedding is None and LLM_PROVIDER == "offline":
+            _embedding = OfflineEmbeddings()
+        if _embedding is None:
+            # Get OpenAI API key from environment variables
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY not found in environment variables. Please check your .env file.")
+
+            # Set OpenAI API key for LangChain
+            os.environ["OPENAI_API_KEY"] = api_key
+
+            from langchain_openai import OpenAIEmbeddings
+            _embedding = OpenAIEmbeddings(openai_api_key=api_key, request_timeout=REQUEST_TIMEOUT_SECONDS,
+                                          max_retries=EMBEDDING_MAX_RETRIES)
+        return _embedding
+
+
+class SubjectIndex:
     """
-    Dynamically builds a FAISS vectorstore from PYQs stored in the database for the given subject.
+    Everything retrieval needs for one subject: the columnar PYQ store, its
+    embedding matrix, the sub_topic centroids and (only for the "faiss"
+    backend, on first use) a FAISS index.
     """
-    query_set = session.query(PYQ)
+
+    def __init__(self, store: PYQColumns, vectors):
+        self.store = store
+        self.matrix = PYQMatrixIndex(vectors, store)
+        self.router = SubtopicRouter(self.matrix)
+        # PYQ version (see _pyq_version) the index was built from
+        self.version = None
+        self._faiss_index = None
+        self._faiss_lock = threading.Lock()
+
+    @property
+    def faiss_index(self):
+        """Flat FAISS index over the same vectors, built only if the FAISS backend is used."""
+        with self._faiss_lock:
+            if self._faiss_index is None:
+                import faiss
+
+                index = faiss.IndexFlatL2(self.matrix.vectors.shape[1])
+                index.add(self.matrix.vectors)
+                self._faiss_index = index
+            return self._faiss_index
+
+
+def load_subject_index(session: Session, subject: str = None) -> SubjectIndex:
+    """
+    Dynamically builds the search index from PYQs stored in the database for the given subject.
+    """
+    store = PYQColumns.load(session, subject)
+    if store is None:
+        return None  # No data to build an index
+    vectors = get_embedding().embed_documents(list(store.questions()))
+    return SubjectIndex(store, vectors)
+
+
+def _pyq_version(session: Session, subject: str = None) -> Tuple[int, Optional[int]]:
+    """
+    Cheap freshness key of the subject's PYQs: their count and largest id.
+    It changes when PYQs are added or deleted (e.g. by data_loader.py).
+    """
+    query = session.query(func.count(PYQ.id), func.max(PYQ.id))
     if subject:
-        query_set = query_set.filter(PYQ.subject == subject)
-
-    pyqs = query_set.all()
-    if not pyqs:
-        return None  # No data to build vector store
-    docs = [
-    Document(
-        page_content=pyq.question,
-        metadata={
-            "year": pyq.year,
-            "subject": pyq.subject,
-            "sub_topic": pyq.sub_topic,
-            "marks": pyq.marks
-        }
-    )
-    for pyq in pyqs
-    ]
-    vectorstore = FAISS.from_documents(docs, embedding)
-    return vectorstore
+        query = query.filter(PYQ.subject == subject)
+    count, max_id = query.one()
+    return count, max_id
+
+
+def get_subject_index(session: Session, subject: str = None) -> SubjectIndex:
+    """
+    Return the cached index for the subject, building it on first use and
+    rebuilding it once the subject's PYQs changed.
+    Concurrent callers for the same subject wait for a single build.
+    """
+    version = _pyq_version(session, subject)
+    with _indexes_lock:
+        index = _indexes.get(subject)
+        if index is not None and index.version == version:
+            return index
+        build_lock = _index_locks.setdefault(subject, threading.Lock())
+
+    with build_lock:
+        with _indexes_lock:
+            index = _indexes.get(subject)
+            if index is not None and index.version == version:
+                return index
+
+        index = load_subject_index(session, subject)
+        with _indexes_lock:
+            # Empty subjects are not cached so newly loaded PYQs are picked up
+            if index is None:
+                _indexes.pop(subject, None)
+            else:
+                index.version = version
+                _indexes[subject] = index
+        return index
+
+
+def get_subtopic_router(session: Session, subject: str = None) -> SubtopicRouter:
+    """
+    Return the precomputed sub_topic centroids for the subject (None if it has no PYQs).
+    """
+    index = get_subject_index(session, subject)
+    return index.router if index else None
+
+
+def get_matrix_index(session: Session, subject: str = None) -> PYQMatrixIndex:
+    """
+    Return the subject's PYQ embedding matrix for exact NumPy search (None if it has no PYQs).
+    """
+    index = get_subject_index(session, subject)
+    return index.matrix if index else None
 
 
 def semantic_search_db(session: Session, query: str, subject: str = None, k: int = 5) -> List[Document]:
     """
     Perform semantic search over PYQs stored in the DB using FAISS.
     """
-    vectorstore = load_vectorstore_from_db(session, subject)
-    if not vectorstore:
+    index = get_subject_index(session, subject)
+    if not index:
         return []
 
-    results = vectorstore.similarity_search(query, k=k)
-    return results
+    query_vector = np.asarray([get_embedding().embed_query(query)], dtype=np.float32)
+    _, rows = index.faiss_index.search(query_vector, min(k, len(index.store)))
+    return index.store.documents([r for r in rows[0] if r >= 0])
+
+
+def route_and_search(session: Session, query: str, subject: str = None, k: int = 3,
+                     n_subtopics: int = 3) -> Tuple[str, List[Document]]:
+    """
+    Two-stage retrieval: route the query to its nearest sub_topic centroids,
+    then search only the PYQs in those sub_topics.
+    Returns the nearest sub_topic as the page label together with the matches.
+    """
+    router = get_subtopic_router(session, subject)
+    if router is None:
+        return "No matches found", []
+
+    query_vector = get_embedding().embed_query(query)
+    return router.search(query_vector, k=k, n_subtopics=n_subtopics)
 
 
-def infer_subtopic(text: str) -> str:
+def infer_subtopic(session: Session, text: str, subject: str = None) -> str:
     """
-    Infer subtopic using OpenAI LLM.
+    Infer subtopic as the nearest precomputed sub_topic centroid.
     """
-    llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo")
-    prompt = (
-        f"Read the following academic content and suggest the most relevant subtopic "
-        f"(like 'Firewall', 'Water Pollution', etc.) in 2-3 words:\n\n{text}\n\nSubtopic:"
-    )
     try:
-        return llm.predict(prompt).strip()
+        router = get_subtopic_router(session, subject)
+        if router is None:
+            return DEFAULT_SUBTOPIC
+        return router.route(get_embedding().embed_query(text), n_subtopics=1)[0][0]
     except Exception as e:
         print("Subtopic inference failed:", e)
-        return "General"
+        return DEFAULT_SUBTOPIC
 
 
-def get_relevant_pyqs(session: Session, query: str, subject: str = None, k: int = 3) -> List[Document]:
+def search_pages(session: Session, pages: List[str], subject: str = None, k: int = 3,
+                 backend: str = None, mmr_lambda: float = MMR_LAMBDA, spread_penalty: float = SPREAD_PENALTY,
+                 shown: Optional[Dict[int, int]] = None) -> List[Tuple[str, List[Document]]]:
+    """
+    Match several pages at once with one embedding request. Every page gets
+    its sub_topic label from the nearest centroid and its top-k PYQs from the
+    given backend (RETRIEVAL_BACKEND by default, see RETRIEVAL_BACKENDS).
+    With the "exact" backend, shown maps PYQ rows to how many earlier pages
+    showed them; it is updated in place, so passing the same dict for every
+    batch of an upload spreads PYQs across the whole upload.
+    """
+    backend = backend or RETRIEVAL_BACKEND
+    if backend not in RETRIEVAL_BACKENDS:
+        raise ValueError(f"Unknown retrieval backend: {backend}")
+
+    index = get_subject_index(session, subject)
+    if index is None or not pages:
+        return [("No matches found", []) for _ in pages]
+
+    query_vectors = get_embedding().embed_documents(pages)
+    if backend == "routed":
+        return [index.router.search(vector, k=k) for vector in query_vectors]
+
+    if backend == "exact":
+        rows = index.matrix.search_batch(query_vectors, k=k, mmr_lambda=mmr_lambda,
+                                         spread_penalty=spread_penalty, shown=shown)
+    else:
+        _, found = index.faiss_index.search(np.asarray(query_vectors, dtype=np.float32), min(k, len(index.store)))
+        rows = [[r for r in row if r >= 0] for row in found.tolist()]
+    return [
+        (index.router.route(vector, n_subtopics=1)[0][0], index.store.documents(r))
+        for vector, r in zip(query_vectors, rows)
+    ]
+
+
+def get_relevant_pyqs(session: Session, query: str, subject: str = None, k: int = 3,
+                      backend: str = None) -> List[Document]:
     """
     Get relevant PYQs from database using semantic similarity search only (no JSON fallback).
+    backend is one of RETRIEVAL_BACKENDS and defaults to RETRIEVAL_BACKEND.
     """
-    return semantic_search_db(session, query, subject, k)
+    return search_pages(session, [query], subject, k, backend)[0][1]
 
 
 def nlp_chunk_text(text: str, max_sentences: int = 5) -> List[str]:
@@ -105,15 +274,9 @@ def process_notes_and_match_pyqs(text: str, subject: str, session: Session, k: i
     results = []
     
     for chunk in chunks:
-        # Get matches first
-        matches = get_relevant_pyqs(session, chunk, subject, k=k)
-        
-        # Then extract subtopic from database results
-        if matches:
-            subtopic = matches[0].metadata.get('sub_topic', 'General')
-        else:
-            subtopic = "No matches found"
-            
+        # Subtopic comes from the nearest centroid, matches from its partitions
+        subtopic, matches = route_and_search(session, chunk, subject, k=k)
+
         results.append({
             "chunk": chunk,
             "subtopic": subtopic,
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from typing import List, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from vector_search import PYQMatrixIndex, normalize_rows
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# Label used for PYQs stored without a sub_topic
+DEFAULT_SUBTOPIC = "General"
+
+
+class SubtopicRouter:
+    """
+    Precomputed sub_topic centroids for one subject's PYQs.
+    A query is first routed to its nearest sub_topic centroids and then
+    searched exactly, but only within those sub_topics' partitions.
+    """
+
+    def __init__(self, index: PYQMatrixIndex):
+        # Shares the index's embedding matrix and columnar store; nothing is copied
+        self.index = index
+        store = index.store
+
+        # Missing and empty sub_topics are both filed under DEFAULT_SUBTOPIC
+        labels = [label or DEFAULT_SUBTOPIC for label in store.sub_topic_labels]
+        self.subtopics = sorted(set(labels))
+        self._codes = {label: c for c, label in enumerate(self.subtopics)}
+        remap = np.array([self._codes[label] for label in labels], dtype=np.int32)
+        codes = remap[store.sub_topic_codes]
+
+        # Row indices belonging to each sub_topic, and the unit-length mean of their vectors
+        self.partitions = [np.flatnonzero(codes == c) for c in range(len(self.subtopics))]
+        self.centroids = normalize_rows(np.stack([index.vectors[rows].mean(axis=0) for rows in self.partitions]))
+
+    def route(self, query_vector, n_subtopics: int = 3) -> List[Tuple[str, float]]:
+        """
+        Return the n_subtopics nearest sub_topics with their cosine similarity, best first.
+        """
+        q = normalize_rows(np.asarray(query_vector, dtype=np.float32))
+        scores = self.centroids @ q
+        n = min(n_subtopics, len(self.subtopics))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        return [(self.subtopics[c], float(scores[c])) for c in top]
+
+    def search_rows(self, query_vector, k: int = 3, n_subtopics: int = 3) -> Tuple[str, List[int]]:
+        """
+        Route the query and return (best sub_topic, top-k store rows from the routed partitions).
+        """
+        routes = self.route(query_vector, n_subtopics)
+        rows = np.concatenate([self.partitions[self._codes[label]] for label, _ in routes])
+
+        q = normalize_rows(np.asarray(query_vector, dtype=np.float32))
+        scores = self.index.vectors[rows] @ q
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return routes[0][0], rows[top].tolist()
+
+    def search(self, query_vector, k: int = 3, n_subtopics: int = 3) -> Tuple[str, List[Document]]:
+        """
+        Route the query and return (best sub_topic, top-k documents from the routed partitions).
+        """
+        subtopic, rows = self.search_rows(query_vector, k, n_subtopics)
+        return subtopic, self.index.documents(rows)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the centroids and partitions (the matrix is shared)."""
+        return self.centroids.nbytes + sum(rows.nbytes for rows in self.partitions)
@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app is a set of top-level modules; make them importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# database.py creates its engine at import time. A file database, because
+# background job threads need to see the same tables.
+_TEST_DB = os.path.join(tempfile.gettempdir(), f"intelliject-tests-{os.getpid()}.db")
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{_TEST_DB}"
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    """Build LLMClients pointed at a FakeOpenAIServer, with a limiter that never throttles by default."""
+    import httpx
+    from llm_client import LLMClient, RateLimiter
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    clients = []
+
+    def make(server, limiter=None):
+        http_client = httpx.Client()
+        clients.append(http_client)
+        limiter = limiter or RateLimiter(requests_per_minute=10000, tokens_per_minute=10_000_000)
+        return LLMClient("gpt-3.5-turbo", 0, limiter, http_client, base_url=server.base_url)
+
+    yield make
+    for http_client in clients:
+        http_client.close()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if os.path.exists(_TEST_DB):
+        os.remove(_TEST_DB)
@@ -0,0 +1,39 @@
+from answer_extractor import _tokenize, score_sentences, select_direct_answer
+
+
+def _direct(sentences, question):
+    return select_direct_answer(sentences, score_sentences(sentences, question), question)
+
+
+def test_plurals_are_folded():
+    assert _tokenize("Firewalls and policies") == ["firewall", "policy"]
+    assert _tokenize("process classes boxes") == ["process", "class", "box"]
+    assert score_sentences(["Firewalls filter traffic."], "What is a firewall?") == [1.0]
+
+
+def test_single_keyword_question_is_never_answered_directly():
+    sentences = ["Firewall.", "A firewall filters incoming and outgoing network traffic using rules."]
+    assert _direct(sentences, "What is a firewall?") == ""
+    assert _direct(sentences, "Explain the types of firewall.") == ""
+
+
+def test_heading_is_not_returned_as_answer():
+    sentences = ["Packet filtering firewall.", "Viruses spread through email attachments and downloads."]
+    assert _direct(sentences, "What is a packet filtering firewall?") == ""
+
+
+def test_clear_answer_is_returned_directly():
+    sentences = [
+        "Viruses spread through email attachments and downloads.",
+        "A packet filtering firewall inspects each packet header against a list of rules.",
+        "Backups should be stored offsite.",
+    ]
+    assert _direct(sentences, "What is a packet filtering firewall?") == sentences[1]
+
+
+def test_close_runner_up_defers_to_llm():
+    sentences = [
+        "A packet filtering firewall inspects each packet header against rules.",
+        "A packet filtering firewall works at the network layer of the stack.",
+    ]
+    assert _direct(sentences, "What is a packet filtering firewall?") == ""
@@ -0,0 +1,27 @@
+import pytest
+
+from evaluate_retrieval import build_eval_set, ndcg_at_k, recall_at_k, reciprocal_rank
+
+# keyword: a word that only appears in that PYQ
+ENTRIES = [
+    {"question": "Explain the various types of firewalls.", "sub_topic": "Perimeter Defence", "keyword": "firewall"},
+    {"question": "What is phishing? How to prevent it?", "sub_topic": "Social Engineering", "keyword": "phishing"},
+    {"question": "Describe the stages of malware analysis.", "sub_topic": "Threat Analysis", "keyword": "malware"},
+]
+
+
+def test_pages_mention_only_their_own_pyq():
+    for entry, page in zip(ENTRIES, build_eval_set(ENTRIES)):
+        text = page["text"].lower()
+        assert entry["keyword"] in text
+        assert entry["sub_topic"].lower() not in text
+        assert not any(other["keyword"] in text for other in ENTRIES if other is not entry)
+
+
+def test_metrics():
+    grades = {4: 2, 7: 1}
+    assert recall_at_k([7, 4, 1], grades, k=2) == 1.0
+    assert recall_at_k([7, 1, 4], grades, k=2) == 0.0
+    assert reciprocal_rank([7, 1, 4], grades) == pytest.approx(1 / 3)
+    assert ndcg_at_k([4, 7], grades, k=2) == pytest.approx(1.0)
+    assert ndcg_at_k([7, 4], grades, k=2) < 1.0
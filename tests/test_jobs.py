@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import jobs
+
+
+def _wait_idle(job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if job_id not in jobs._running and jobs.get_job(job_id)["status"] in ("done", "paused"):
+            return
+        time.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+
+def test_sessions_sharing_a_job_keep_their_own_pages_and_budgets(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    processed = []
+
+    def fake_process_page(chunk, subject, i, upload_pages, retrieved, budget, on_update):
+        started.set()
+        release.wait(5)
+        processed.append((i, budget.page_seconds))
+        return {"page": i + 1, "subtopic": "t", "matches": [], "answers": []}, {}
+
+    monkeypatch.setattr(jobs, "process_page", fake_process_page)
+    chunks = [f"page {n}" for n in range(8)]
+    job_id = jobs.job_id_for(b"shared pdf", "Test")
+
+    jobs.submit_job(job_id, "Test", "notes.pdf", chunks, [0, 1], page_budget=3, requester="a")
+    started.wait(5)
+    # A second viewer of the same PDF must not replace the first one's window or budget
+    jobs.submit_job(job_id, "Test", "notes.pdf", chunks, [4, 5], page_budget=7, requester="b")
+    release.set()
+    _wait_idle(job_id)
+
+    assert sorted(processed) == [(0, 3), (1, 3), (4, 7), (5, 7)]
+    # The more recent request is served first
+    assert [i for i, _ in processed][1:3] == [4, 5]
+    assert jobs.get_job_stats(job_id, "a")["timeouts"] == 0
+    assert jobs.get_job_stats(job_id, "c") is None
+    assert sorted(jobs.get_job_pages(job_id)) == [0, 1, 4, 5]
+
+
+def test_new_request_replaces_only_the_requesters_own_pages(monkeypatch):
+    processed = []
+    release = threading.Event()
+
+    def fake_process_page(chunk, subject, i, upload_pages, retrieved, budget, on_update):
+        release.wait(5)
+        processed.append(i)
+        return {"page": i + 1, "subtopic": "t", "matches": [], "answers": []}, {}
+
+    monkeypatch.setattr(jobs, "process_page", fake_process_page)
+    chunks = [f"page {n}" for n in range(8)]
+    job_id = jobs.job_id_for(b"moving viewer", "Test")
+
+    jobs.submit_job(job_id, "Test", "notes.pdf", chunks, [0, 1, 2], requester="a")
+    jobs.submit_job(job_id, "Test", "notes.pdf", chunks, [6], requester="b")
+    # Viewer "a" moves on; its old window is dropped, "b"'s request stays
+    jobs.submit_job(job_id, "Test", "notes.pdf", chunks, [3], requester="a")
+    release.set()
+    _wait_idle(job_id)
+
+    assert 6 in processed and 3 in processed
+    assert not {1, 2} & set(processed)
+
+
+def test_failed_pages_are_retried_when_resubmitted(monkeypatch):
+    calls = []
+
+    def flaky_search(chunks, subject, shown=None):
+        calls.append(list(chunks))
+        if len(calls) == 1:
+            raise RuntimeError("embeddings timed out")
+        return [("Topic", []) for _ in chunks]
+
+    monkeypatch.setattr("page_processor.search_upload", flaky_search)
+    chunks = ["only page"]
+    job_id = jobs.job_id_for(b"flaky retrieval", "Test")
+
+    jobs.submit_job(job_id, "Test", "notes.pdf", chunks, page_budget=0)
+    _wait_idle(job_id)
+    assert "error" in jobs.get_job_pages(job_id)[0]
+    assert jobs.get_job(job_id)["status"] == "paused"
+
+    jobs.submit_job(job_id, "Test", "notes.pdf", chunks, page_budget=0)
+    _wait_idle(job_id)
+    assert "error" not in jobs.get_job_pages(job_id)[0]
+    assert jobs.get_job(job_id)["status"] == "done"
+
+
+def test_failed_late_answer_reopens_the_job(monkeypatch):
+    late = Future()
+
+    def fake_process_page(chunk, subject, i, upload_pages, retrieved, budget, on_update):
+        budget.record(outstanding=1)
+        return {"page": i + 1, "subtopic": "t", "matches": [{}], "answers": [None]}, {0: late}
+
+    monkeypatch.setattr(jobs, "process_page", fake_process_page)
+    job_id = jobs.job_id_for(b"late failure", "Test")
+    jobs.submit_job(job_id, "Test", "notes.pdf", ["only page"])
+    _wait_idle(job_id)
+    assert jobs.get_job(job_id)["status"] == "done"
+
+    late.set_result(None)
+    page = jobs.get_job_pages(job_id)[0]
+    assert page["answers"] == [None] and page["failed"] == [0]
+    assert jobs.get_job(job_id)["status"] == "paused"
+
+
+def test_finished_jobs_release_spreading_state_and_idle_budgets(monkeypatch):
+    def fake_process_page(chunk, subject, i, upload_pages, retrieved, budget, on_update):
+        return {"page": i + 1, "subtopic": "t", "matches": [], "answers": []}, {}
+
+    monkeypatch.setattr(jobs, "process_page", fake_process_page)
+    job_id = jobs.job_id_for(b"short lived", "Test")
+    jobs.submit_job(job_id, "Test", "notes.pdf", ["only page"], requester="a")
+    _wait_idle(job_id)
+    assert job_id not in jobs._shown
+    assert jobs.get_job_stats(job_id, "a") is not None
+
+    # Nobody polls the finished job any more; the next submission sweeps its budget
+    monkeypatch.setattr(jobs, "BUDGET_IDLE_SECONDS", 0)
+    time.sleep(0.01)
+    other_id = jobs.job_id_for(b"other upload", "Test")
+    jobs.submit_job(other_id, "Test", "other.pdf", ["page"], requester="b")
+    assert job_id not in jobs._budgets
+    _wait_idle(other_id)
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+import answer_extractor
+import rag_pipeline
+from latency_budget import Deadline, LatencyBudget
+from page_processor import match_page, process_page
+
+DOCS = [Document(page_content=q, metadata={}) for q in ("What is a firewall?", "Define malware", "What is phishing?")]
+
+
+def test_deadline():
+    assert Deadline(None).remaining() is None and not Deadline(None).expired()
+    assert Deadline(0).expired()
+    assert 0.9 < Deadline(1).remaining() <= 1
+
+
+def test_page_deadline_is_capped_by_upload_budget():
+    budget = LatencyBudget(page_seconds=10, upload_seconds=3)
+    assert budget.page_deadline().remaining() == pytest.approx(3, abs=0.05)
+    budget.charge(2.5)
+    assert budget.page_deadline().remaining() == pytest.approx(0.5, abs=0.05)
+    budget.charge(1)
+    assert budget.upload_exhausted() and budget.page_deadline().expired()
+
+
+def test_zero_means_no_limit():
+    budget = LatencyBudget(page_seconds=0, upload_seconds=0)
+    assert budget.page_deadline().remaining() is None
+    budget.charge(1000)
+    assert not budget.upload_exhausted()
+
+
+@pytest.fixture
+def extraction(monkeypatch):
+    """Fake extraction; answers for questions in `slow` wait until released."""
+    release = threading.Event()
+    slow = set()
+
+    def extract(chunk, question, on_text=None):
+        if question in slow:
+            release.wait(5)
+        return f"answer to {question}"
+
+    monkeypatch.setattr(answer_extractor, "extract_answer_from_chunk", extract)
+    yield slow, release
+    release.set()
+
+
+def test_page_is_returned_at_its_deadline_with_late_answers_outstanding(extraction):
+    slow, release = extraction
+    slow.add("Define malware")
+    budget = LatencyBudget(page_seconds=0.2, upload_seconds=0)
+
+    start = time.monotonic()
+    result, outstanding = match_page("notes one", "S", ("Security", DOCS), budget)
+    assert time.monotonic() - start < 1
+    assert result["answers"] == ["answer to What is a firewall?", None, "answer to What is phishing?"]
+    assert list(outstanding) == [1]
+    assert budget.stats()["timeouts"] == 1 and budget.stats()["outstanding"] == 1
+
+    release.set()
+    assert outstanding[1].result(timeout=5) == "answer to Define malware"
+
+
+def test_retrieval_counts_against_the_page_deadline(extraction, monkeypatch):
+    slow, _ = extraction
+    slow.add("What is a firewall?")
+
+    def slow_search(session, pages, subject=None, k=3, **kwargs):
+        time.sleep(0.3)
+        return [("Security", DOCS[:1])]
+
+    monkeypatch.setattr(rag_pipeline, "search_pages", slow_search)
+    budget = LatencyBudget(page_seconds=0.4, upload_seconds=0)
+    start = time.monotonic()
+    result, outstanding = match_page("notes two", "S", budget=budget)
+    assert time.monotonic() - start < 0.6
+    assert list(outstanding) == [0]
+
+
+
+def test_retrieval_is_cut_off_at_the_page_deadline(monkeypatch):
+    release = threading.Event()
+
+    def hanging_search(session, pages, subject=None, k=3, **kwargs):
+        release.wait(5)
+        return [("Security", DOCS[:1])]
+
+    monkeypatch.setattr(rag_pipeline, "search_pages", hanging_search)
+    budget = LatencyBudget(page_seconds=0.2, upload_seconds=0)
+    start = time.monotonic()
+    result, outstanding = process_page("notes three", "S", 0, budget=budget)
+    release.set()
+    assert time.monotonic() - start < 1
+    assert "latency budget" in result["error"] and not outstanding
+    assert budget.stats()["timeouts"] == 1
+
+
+def test_exhausted_upload_budget_skips_uncached_answers(extraction):
+    budget = LatencyBudget(page_seconds=5, upload_seconds=1)
+    budget.charge(1)
+    answer_extractor._cache_answer("notes four", "What is a firewall?", "cached answer")
+
+    result, outstanding = match_page("notes four", "S", ("Security", DOCS[:2]), budget)
+    assert result["answers"] == ["cached answer", None]
+    assert result["skipped"] == [1] and not outstanding
+    assert budget.stats()["cancellations"] == 1
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import llm_client
+from fake_openai_server import FakeOpenAIServer
+from llm_client import RateLimiter
+
+
+def test_complete_returns_reply(make_client):
+    with FakeOpenAIServer(reply="  Firewalls filter traffic.  ") as server:
+        assert make_client(server).complete("prompt") == "Firewalls filter traffic."
+        assert server.requests == 1
+
+
+def test_identical_concurrent_prompts_share_one_request(make_client):
+    with FakeOpenAIServer(reply="shared", delay=0.3) as server:
+        client = make_client(server)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(client.complete("same prompt")))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert results == ["shared"] * 8
+        assert server.requests == 1
+
+        # Once finished, the same prompt goes upstream again
+        client.complete("same prompt")
+        assert server.requests == 2
+
+
+def test_different_prompts_are_not_coalesced(make_client):
+    with FakeOpenAIServer(delay=0.1) as server:
+        client = make_client(server)
+        threads = [threading.Thread(target=client.complete, args=(f"prompt {i}",)) for i in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert server.requests == 3
+
+
+def test_rate_limited_requests_are_retried(make_client, monkeypatch):
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE_SECONDS", 0.01)
+    with FakeOpenAIServer(reply="ok", fail_first=2) as server:
+        assert make_client(server).complete("prompt") == "ok"
+        assert server.requests == 3
+
+
+def test_retries_go_through_the_limiter(make_client, monkeypatch):
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE_SECONDS", 0.01)
+    acquired = []
+
+    class CountingLimiter(RateLimiter):
+        def acquire(self, tokens):
+            acquired.append(tokens)
+            super().acquire(tokens)
+
+    limiter = CountingLimiter(requests_per_minute=10000, tokens_per_minute=10_000_000)
+    with FakeOpenAIServer(fail_first=1) as server:
+        make_client(server, limiter).complete("prompt")
+    assert len(acquired) == 2
+
+
+def test_rate_limiter_blocks_past_request_budget():
+    # 600 requests per minute: a full bucket of 600, then one every 0.1s
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=10_000_000)
+    start = time.monotonic()
+    for _ in range(600):
+        limiter.acquire(1)
+    assert time.monotonic() - start < 0.2
+
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire(1)
+    assert 0.2 < time.monotonic() - start < 0.6
+
+
+def test_rate_limiter_blocks_past_token_budget():
+    # 60000 tokens per minute refill at 1000 per second
+    limiter = RateLimiter(requests_per_minute=10000, tokens_per_minute=60000)
+    limiter.acquire(60000)
+    start = time.monotonic()
+    limiter.acquire(300)
+    assert 0.2 < time.monotonic() - start < 0.6
+
+
+def test_oversized_request_does_not_wait_forever():
+    limiter = RateLimiter(requests_per_minute=10000, tokens_per_minute=1000)
+    start = time.monotonic()
+    limiter.acquire(5000)
+    assert time.monotonic() - start < 0.1
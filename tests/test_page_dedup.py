@@ -0,0 +1,68 @@
+import threading
+
+from langchain_core.documents import Document
+
+import answer_extractor
+from latency_budget import LatencyBudget
+from page_dedup import MAX_HAMMING_DISTANCE, NearDuplicateIndex, get_result_store, hamming_distance, simhash
+from page_processor import process_page, remember_page
+
+SLIDE = ("A firewall is a network security device that monitors incoming and outgoing traffic "
+         "and decides whether to allow or block it based on a defined set of security rules. "
+         "Firewalls have been a first line of defense in network security for over 25 years.")
+
+
+def test_build_up_slide_is_near_duplicate():
+    build_up = SLIDE + " They can be hardware, software or both."
+    assert hamming_distance(simhash(SLIDE), simhash(build_up)) <= MAX_HAMMING_DISTANCE
+
+
+def test_different_pages_are_not_near_duplicates():
+    other = ("Malware is any software intentionally designed to cause disruption to a computer, "
+             "server, client or network, leak private information or gain unauthorized access.")
+    assert hamming_distance(simhash(SLIDE), simhash(other)) > MAX_HAMMING_DISTANCE
+
+
+def test_find_returns_closest_entry():
+    index = NearDuplicateIndex()
+    index.add(simhash(SLIDE), "firewall page")
+    assert index.find(simhash(SLIDE + " They can be hardware, software or both.")) == "firewall page"
+    assert index.find(simhash("Completely unrelated text about probability distributions and variance.")) is None
+
+
+def test_oldest_entries_are_evicted():
+    index = NearDuplicateIndex(max_entries=2)
+    # 32 bits apart from each other, far beyond the near-duplicate distance
+    fingerprints = [0, 0xFFFFFFFF, 0xFFFFFFFF << 32]
+    for fingerprint in fingerprints:
+        index.add(fingerprint, fingerprint)
+    assert index.find(fingerprints[0]) is None
+    assert index.find(fingerprints[1]) == fingerprints[1]
+    assert index.find(fingerprints[2]) == fingerprints[2]
+
+
+def test_page_with_late_answers_is_reused_once_complete(monkeypatch):
+    release = threading.Event()
+
+    def slow_extract(chunk, question, on_text=None):
+        release.wait(5)
+        return "late answer"
+
+    monkeypatch.setattr(answer_extractor, "extract_answer_from_chunk", slow_extract)
+    subject = "test-late-dedup"
+    docs = [Document(page_content="What is a firewall?", metadata={})]
+    upload_pages = NearDuplicateIndex()
+
+    result, outstanding = process_page(SLIDE, subject, 0, upload_pages, ("Firewalls", docs),
+                                       LatencyBudget(page_seconds=0.05, upload_seconds=0))
+    assert result["answers"] == [None] and list(outstanding) == [0]
+    assert upload_pages.find(simhash(SLIDE)) is None
+    assert get_result_store(subject).find(simhash(SLIDE)) is None
+
+    release.set()
+    result = dict(result, answers=[outstanding[0].result()])
+    remember_page(SLIDE, subject, result, upload_pages)
+
+    reused, outstanding = process_page(SLIDE, subject, 1, upload_pages)
+    assert reused["reused_from"] == 1 and reused["answers"] == ["late answer"]
+    assert not outstanding
@@ -0,0 +1,49 @@
+import re
+
+import numpy as np
+
+import answer_extractor
+import llm_client
+from fake_openai_server import FakeOpenAIServer
+from llm_client import OfflineEmbeddings, OfflineLLMClient
+
+
+def test_stream_yields_reply_in_pieces(make_client):
+    with FakeOpenAIServer(reply="Firewalls filter network traffic.") as server:
+        pieces = list(make_client(server).stream("prompt"))
+    assert len(pieces) > 1
+    assert "".join(pieces) == "Firewalls filter network traffic."
+
+
+def test_stream_retries_before_the_first_token(make_client, monkeypatch):
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE_SECONDS", 0.01)
+    with FakeOpenAIServer(reply="ok then", fail_first=1) as server:
+        assert "".join(make_client(server).stream("prompt")) == "ok then"
+        assert server.requests == 2
+
+
+def test_offline_client_streams_best_matching_sentence():
+    client = OfflineLLMClient(token_delay=0)
+    prompt = answer_extractor.build_extraction_prompt(
+        "A firewall filters traffic. Malware is malicious software that harms systems.", "Define malware")
+    assert client.complete(prompt) == "Malware is malicious software that harms systems."
+    assert list(client.stream(prompt))[:2] == ["Malware", " is"]
+
+
+def test_offline_embeddings_rank_shared_words_higher():
+    embedding = OfflineEmbeddings()
+    docs = np.array(embedding.embed_documents(["What are firewalls?", "Explain phishing attacks."]))
+    query = np.array(embedding.embed_query("Packet filtering firewall rules"))
+    assert np.argmax(docs @ query) == 0
+
+
+def test_answer_text_is_reported_as_it_streams(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_PROVIDER", "offline")
+    monkeypatch.setattr(llm_client, "_offline_client", OfflineLLMClient(token_delay=0))
+    monkeypatch.setattr(answer_extractor, "_split_sentences",
+                        lambda chunk: [s for s in re.split(r"(?<=[.!?])\s+", chunk) if s])
+    chunk = "Firewall. Malware is software designed to harm a system. Phishing tricks users into sharing secrets."
+    seen = []
+    answer = answer_extractor.extract_answer_from_chunk(chunk, "Define malware", on_text=seen.append)
+    assert answer == "Malware is software designed to harm a system."
+    assert seen[0] == "Malware" and seen[-1] == answer
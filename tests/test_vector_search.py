@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+import rag_pipeline
+from pyq_store import PYQColumns
+from vector_search import PYQMatrixIndex
+
+# Four PYQs in a 3-d embedding space: two near-duplicates along x, one along y, one along z
+VECTORS = np.array([
+    [1.0, 0.0, 0.0],
+    [0.99, 0.14, 0.0],
+    [0.0, 1.0, 0.0],
+    [0.0, 0.0, 1.0],
+], dtype=np.float32)
+
+
+def _store():
+    return PYQColumns(
+        ["What is a firewall?", "Define a firewall.", "What is malware?", "What is phishing?"],
+        ["Cyber Security"] * 4,
+        ["Firewalls", "Firewalls", "Malware", "Phishing"],
+        [2020, 2021, None, 2022],
+        [5.0, 2.0, 5.0, None],
+    )
+
+
+@pytest.fixture
+def index():
+    return PYQMatrixIndex(VECTORS, _store())
+
+
+def test_top_k_is_exact_cosine_order(index):
+    assert index.search_batch([[1.0, 0.2, 0.0]], k=3) == [[1, 0, 2]]
+    assert index.search_batch([[0.0, 0.0, 2.0], [0.1, 1.0, 0.0]], k=1) == [[3], [2]]
+
+
+def test_k_larger_than_corpus_returns_everything(index):
+    assert sorted(index.search_batch([[1.0, 0.0, 0.0]], k=10)[0]) == [0, 1, 2, 3]
+
+
+def test_mmr_skips_near_duplicate(index):
+    query = [[1.0, 0.5, 0.0]]
+    assert index.search_batch(query, k=2)[0] == [1, 0]
+    assert index.search_batch(query, k=2, mmr_lambda=0.5)[0] == [1, 2]
+
+
+def test_mmr_with_lambda_one_is_plain_top_k(index):
+    query = [[1.0, 0.5, 0.1]]
+    assert index.search_batch(query, k=3, mmr_lambda=1.0) == index.search_batch(query, k=3)
+
+
+def test_spreading_pushes_down_pyqs_shown_on_earlier_pages(index):
+    pages = [[1.0, 0.05, 0.0]] * 2
+    assert index.search_batch(pages, k=1) == [[0], [0]]
+    assert index.search_batch(pages, k=1, spread_penalty=0.05) == [[0], [1]]
+
+
+def test_spreading_carries_over_between_batches(index):
+    shown = {}
+    page = [[1.0, 0.05, 0.0]]
+    assert index.search_batch(page, k=1, spread_penalty=0.05, shown=shown) == [[0]]
+    assert index.search_batch(page, k=1, spread_penalty=0.05, shown=shown) == [[1]]
+    assert shown == {0: 1, 1: 1}
+
+
+def test_documents_carry_metadata(index):
+    doc = index.documents([2])[0]
+    assert doc.page_content == "What is malware?"
+    assert doc.metadata == {"year": None, "subject": "Cyber Security", "sub_topic": "Malware", "marks": 5.0}
+
+
+class _FakeEmbedding:
+    def embed_documents(self, texts):
+        return [{"firewall": [1.0, 0.05, 0.0], "malware": [0.0, 1.0, 0.1]}[t] for t in texts]
+
+
+@pytest.fixture
+def subject_index(monkeypatch):
+    subject_index = rag_pipeline.SubjectIndex(_store(), VECTORS)
+    monkeypatch.setattr(rag_pipeline, "get_subject_index", lambda session, subject=None: subject_index)
+    monkeypatch.setattr(rag_pipeline, "get_embedding", lambda: _FakeEmbedding())
+    return subject_index
+
+
+@pytest.mark.parametrize("backend", ["routed", "exact", "faiss"])
+def test_every_backend_labels_and_matches_pages(subject_index, backend):
+    if backend == "faiss":
+        pytest.importorskip("faiss")
+    results = rag_pipeline.search_pages(None, ["firewall", "malware"], k=1, backend=backend)
+    assert [subtopic for subtopic, _ in results] == ["Firewalls", "Malware"]
+    assert results[1][1][0].page_content == "What is malware?"
+
+
+def test_only_the_faiss_backend_builds_a_faiss_index(subject_index):
+    rag_pipeline.search_pages(None, ["firewall"], backend="routed")
+    rag_pipeline.search_pages(None, ["firewall"], backend="exact")
+    assert subject_index._faiss_index is None
+
+
+def test_unknown_backend_is_rejected(subject_index):
+    with pytest.raises(ValueError):
+        rag_pipeline.search_pages(None, ["firewall"], backend="numpy")
+
+
+def test_subject_index_is_rebuilt_after_new_pyqs(monkeypatch):
+    from database import PYQ, Base, SessionLocal, engine
+    from llm_client import OfflineEmbeddings
+
+    Base.metadata.create_all(bind=engine, tables=[PYQ.__table__])
+    monkeypatch.setattr(rag_pipeline, "get_embedding", lambda: OfflineEmbeddings())
+    with SessionLocal() as session:
+        session.add(PYQ(question="What is a firewall?", subject="Freshness", sub_topic="Firewalls"))
+        session.commit()
+        first = rag_pipeline.get_subject_index(session, "Freshness")
+        assert rag_pipeline.get_subject_index(session, "Freshness") is first
+
+        # e.g. data_loader.py adding PYQs while the app is running
+        session.add(PYQ(question="What is malware?", subject="Freshness", sub_topic="Malware"))
+        session.commit()
+        assert len(rag_pipeline.get_subject_index(session, "Freshness").store) == 2
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from pyq_store import PYQColumns
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors to unit length so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k best scores per row, best first."""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+class PYQMatrixIndex:
+    """
+    Exact cosine search over one subject's PYQs held as a contiguous float32
+    matrix. A whole upload is scored with a single matrix multiply.
+    """
+
+    def __init__(self, vectors: np.ndarray, store: PYQColumns):
+        self.vectors = np.ascontiguousarray(normalize_rows(np.asarray(vectors, dtype=np.float32)))
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def _mmr(self, scores: np.ndarray, k: int, mmr_lambda: float, fetch_k: int) -> np.ndarray:
+        """
+        Maximal marginal relevance over each row's fetch_k best candidates,
+        vectorized across rows. Returns k row indices per query.
+        """
+        rows = np.arange(scores.shape[0])[:, None]
+        candidates = _top_k(scores, max(fetch_k, k))
+        relevance = scores[rows, candidates]
+        cand_vectors = self.vectors[candidates]                       # (m, f, d)
+        pairwise = cand_vectors @ cand_vectors.transpose(0, 2, 1)     # (m, f, f)
+
+        k = min(k, candidates.shape[1])
+        picked = np.empty((scores.shape[0], k), dtype=np.int64)
+        chosen = np.zeros(candidates.shape, dtype=bool)
+        # Highest similarity of each candidate to anything already picked
+        max_sim = np.zeros(candidates.shape, dtype=np.float32)
+        for step in range(k):
+            mmr = mmr_lambda * relevance - (1 - mmr_lambda) * max_sim
+            mmr[chosen] = -np.inf
+            best = np.argmax(mmr, axis=1)
+            picked[:, step] = best
+            chosen[rows[:, 0], best] = True
+            max_sim = np.maximum(max_sim, pairwise[rows[:, 0], best])
+        return np.take_along_axis(candidates, picked, axis=1)
+
+    def search_batch(self, query_vectors, k: int = 3, mmr_lambda: Optional[float] = None,
+                     fetch_k: int = 20, spread_penalty: float = 0.0,
+                     shown: Optional[Dict[int, int]] = None) -> List[List[int]]:
+        """
+        Top-k PYQ row indices for every query vector (one row per page).
+
+        mmr_lambda: when set, re-rank each page's fetch_k best candidates with
+            MMR (1.0 = pure relevance) so near-duplicate questions are not all returned.
+        spread_penalty: when > 0, pages are ranked in order and every earlier
+            page that already showed a PYQ lowers its score by this amount, so
+            the same question is not repeated on every page.
+        shown: counts of earlier pages per PYQ row from previous calls, updated
+            in place, so spreading carries over when an upload is searched in batches.
+        """
+        if not len(self):
+            return [[] for _ in range(len(query_vectors))]
+
+        queries = normalize_rows(np.asarray(query_vectors, dtype=np.float32).reshape(-1, self.vectors.shape[1]))
+        scores = queries @ self.vectors.T   # (pages, pyqs)
+
+        def rank(block: np.ndarray) -> np.ndarray:
+            if mmr_lambda is None:
+                return _top_k(block, k)
+            return self._mmr(block, k, mmr_lambda, fetch_k)
+
+        if spread_penalty <= 0:
+            return rank(scores).tolist()
+
+        # Spreading depends on earlier pages' picks, so pages are ranked one by one
+        counts = np.zeros(len(self), dtype=np.float32)
+        for r, count in (shown or {}).items():
+            if r < len(self):
+                counts[r] = count
+        results = []
+        for row in scores:
+            top = rank((row - spread_penalty * counts)[None, :])[0]
+            counts[top] += 1
+            results.append(top.tolist())
+            if shown is not None:
+                for r in results[-1]:
+                    shown[r] = shown.get(r, 0) + 1
+        return results
+
+    def documents(self, rows: List[int]) -> List[Document]:
+        return self.store.documents(rows)
@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from database import SessionLocal
+
+# Startup and first-result timings in seconds, shown in the sidebar
+_timings: Dict[str, float] = {}
+_timings_lock = threading.Lock()
+
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+
+def record_timing(name: str, seconds: float):
+    """Store a named timing and print it to the server log."""
+    with _timings_lock:
+        _timings[name] = seconds
+    print(f"⏱️ {name}: {seconds:.2f}s")
+
+
+def get_timings() -> Dict[str, float]:
+    with _timings_lock:
+        return dict(_timings)
+
+
+def _available_subjects() -> List[str]:
+    with SessionLocal() as db:
+        rows = db.execute(text("SELECT DISTINCT subject FROM pyqs")).fetchall()
+    return [row[0] for row in rows]
+
+
+def _warm_up():
+    start = time.perf_counter()
+
+    # Load the NLTK punkt model used by sentence splitting
+    try:
+        from nltk.tokenize import sent_tokenize
+        sent_tokenize("Warm up the sentence tokenizer. It is loaded lazily.")
+        record_timing("warmup: nltk punkt", time.perf_counter() - start)
+    except Exception as e:
+        print("NLTK warm-up failed:", e)
+
+    try:
+        import rag_pipeline
+        subjects = _available_subjects()
+    except Exception as e:
+        print("Index warm-up failed:", e)
+        return
+
+    for subject in subjects:
+        t0 = time.perf_counter()
+        try:
+            # A FAISS copy of the vectors is not built here; the "faiss" backend
+            # builds it on its first search, so other backends never hold one
+            with SessionLocal() as session:
+                rag_pipeline.get_subject_index(session, subject)
+            record_timing(f"warmup: index '{subject}'", time.perf_counter() - t0)
+        except Exception as e:
+            print(f"Index warm-up failed for {subject}:", e)
+
+    record_timing("warmup: total", time.perf_counter() - start)
+
+
+def start_warmup():
+    """
+    Preload the NLTK punkt model and every subject's index in a background
+    thread. Only the first call per process starts the thread.
+    """
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_warm_up, name="intelliject-warmup", daemon=True)
+            _warmup_thread.start()
+
+
+def warmup_done() -> bool:
+    return _warmup_thread is not None and not _warmup_thread.is_alive()